@@ -4,6 +4,115 @@
  *  Created on: Jan 21, 2025
  *      Author: Severin Konishi
 """
+import numpy as np
+
+#Error in a frame (bit stuffing, form), the decoding continues at the next start of frame
+class FrameError(Exception):
+    pass
+
+#The capture ends before the end of the frame
+class IncompleteFrame(FrameError):
+    pass
+
+#CRC polynomials of the classic (15 bits) and FD frames (17 and 21 bits)
+crc_polynomials = {15: 0x4599, 17: 0x1685B, 21: 0x102899}
+
+#CRC lookup table to process 8 bits at a time (most significant bit first)
+def crc_table(polynomial, width):
+    table = []
+    for byte in range(256):
+        value = byte << (width-8)
+        for i in range(8):
+            value = value << 1 ^ polynomial if value & 1 << (width-1) else value << 1
+        table.append(value & ((1 << width) - 1))
+    return table
+
+crc_tables = {width: crc_table(polynomial, width) for width, polynomial in crc_polynomials.items()}
+
+#CRC of the first bits bits of value (the first bit is the most significant one)
+def crc(value, bits, width, init=0):
+    table = crc_tables[width]
+    mask = (1 << width) - 1
+    result = init
+    position = bits
+    while position >= 8:
+        position -= 8
+        result = (result << 8 & mask) ^ table[(result >> (width-8) ^ value >> position) & 0xFF]
+    #remaining bits one by one
+    while position > 0:
+        position -= 1
+        top = (result >> (width-1) ^ value >> position) & 1
+        result = result << 1 & mask
+        if top:
+            result ^= crc_polynomials[width]
+    return result
+
+#stuff count of the FD frames (number of dynamic stuff bits modulo 8) in gray code
+gray_codes = [i ^ (i >> 1) for i in range(8)]
+
+#Frame state machine: field -> (number of bits, stuffing, next field)
+#the number of bits and the stuffing can depend on the fields already read: function(parser, packet), the next field is function(parser, packet) (None at the end)
+#stuffing: "dynamic" (a stuff bit after 5 identical bits), "fixed" (fixed stuff bit before every 4 bits, stuff count and CRC of the FD frames)
+#or None (fixed form fields)
+#RTR is the SRR bit in extended frames and the RRS bit in the FD frames, the FDF bit is r0 in the classic frames (r1 in extended classic frames)
+frame_fields = {
+    "sync":             (1, "dynamic", lambda parser, packet: "identifier"),
+    "identifier":       (11, "dynamic", lambda parser, packet: "RTR"),
+    "RTR":              (1, "dynamic", lambda parser, packet: "IDE"),
+    "IDE":              (1, "dynamic", lambda parser, packet: "identifier_ext" if packet["IDE"] else "FDF"),
+    "identifier_ext":   (18, "dynamic", lambda parser, packet: "RTR_ext"),
+    "RTR_ext":          (1, "dynamic", lambda parser, packet: "FDF"),
+    "FDF":              (1, "dynamic", lambda parser, packet: "res" if packet["FDF"] else ("r0" if packet["IDE"] else "DLC")),
+    "r0":               (1, "dynamic", lambda parser, packet: "DLC"),
+    "res":              (1, "dynamic", lambda parser, packet: "BRS"),
+    "BRS":              (1, "dynamic", lambda parser, packet: "ESI"),
+    "ESI":              (1, "dynamic", lambda parser, packet: "DLC"),
+    "DLC":              (4, "dynamic", lambda parser, packet: "Data" if parser.data_length(packet) > 0 else ("StuffCount" if packet["FDF"] else "CRC")),
+    "Data":             (lambda parser, packet: 8*parser.data_length(packet), "dynamic", lambda parser, packet: "StuffCount" if packet["FDF"] else "CRC"),
+    "StuffCount":       (3, "fixed", lambda parser, packet: "StuffCountParity"),
+    "StuffCountParity": (1, "fixed", lambda parser, packet: "CRC"),
+    "CRC":              (lambda parser, packet: parser.crc_width(packet), lambda parser, packet: "fixed" if packet["FDF"] else "dynamic", lambda parser, packet: "CRCdelim"),
+    "CRCdelim":         (1, None, lambda parser, packet: "ACK"),
+    "ACK":              (1, None, lambda parser, packet: "ACKdelim"),
+    "ACKdelim":         (1, None, lambda parser, packet: None),
+}
+
+#Bus load statistics of the decoded frames: utilisation (time occupied by the frames / captured time) and inter-frame gaps
+class BusStats:
+    def __init__(self):
+        self.frames = 0
+        self.errors = 0         #frames that could not be decoded
+        self.crc_errors = 0     #frames decoded with a wrong CRC
+        self.busy = 0           #time occupied by the decoded frames in s
+        self.observed = 0       #captured time in s
+        self.gaps = []          #time between the end of a frame and the start of the next one in s
+        self.last_end = None    #end of the last frame (None after a discontinuity of the capture)
+
+    def observe(self, duration):
+        self.observed += duration
+
+    def record(self, packet):
+        self.frames += 1
+        if not packet["CRCvalid"]:
+            self.crc_errors += 1
+        self.busy += packet["end"] - packet["start"]
+        if self.last_end is not None:
+            self.gaps.append(packet["start"] - self.last_end)
+        self.last_end = packet["end"]
+
+    #the next samples do not follow the previous ones (new acquisition)
+    def discontinuity(self):
+        self.last_end = None
+
+    def utilisation(self):
+        return self.busy/self.observed if self.observed > 0 else 0
+
+    def report(self):
+        lines = ["{0} frames ({1} CRC errors), {2} errors in {3:.6f}s, bus utilisation {4:.1f}%".format(self.frames, self.crc_errors, self.errors, self.observed,
+                 100*self.utilisation())]
+        if len(self.gaps) > 0:
+            lines.append("inter-frame gap: min {0:.2f}us, mean {1:.2f}us, max {2:.2f}us".format(min(self.gaps)*1e6, sum(self.gaps)/len(self.gaps)*1e6, max(self.gaps)*1e6))
+        return lines
 
 #Class used to retrieve CANFD packets from oscilloscope readings
 class CANFDParser:
@@ -12,134 +121,298 @@ class CANFDParser:
         self.std_bitrate = 1000000  #standard CAN speed
         self.fd_bitrate = 4000000   #FD CAN speed
         self.sample_point = 0.75    #when to sample in % (50% for the middle of the bit)
+        self.fd_sample_point = 0.75 #sample point of the data phase (FD frames with bit rate switch)
+        self.sjw = 0.25             #resynchronization jump width in % of the bit (0: no resynchronization, only the hard sync on the start of frame)
+        self.fd_sjw = 0.25          #resynchronization jump width of the data phase
+        self.idle_bits = 10         #recessive bits before a start of frame (ACK delimiter + end of frame + intermission: 11 bits)
+        self.verbose = True         #print the bit buffer on errors
 
         #to decode FD packet length
         self.dlc_fd_map = [0,1,2,3,4,5,6,7,8,12,16,20,24,32,48,64]
 
     #the inputs are the results of get_time and get_wave of the Analyzer class
+    #decodes the first frame of the capture and prints it
     def parse(self, time, ch1, ch2):
+        self.load(time, ch1, ch2)
+        #start of frame on the first edge
+        self.seek_edge()
+        packet = self.decode_frame()
+
+        print("===== Decoded bytes =====")
+        self.print_packet(packet)
+        print("===== Raw bit buffer =====")
+        print(self.buffer)
+        return packet
+
+    #decodes every frame of the capture (iterator of packets), stats: optional BusStats
+    def parse_all(self, time, ch1, ch2, stats=None):
+        self.load(time, ch1, ch2)
+        if stats is not None:
+            stats.discontinuity()
+            stats.observe(self.time[-1] - self.time[0])
+        return self.frames(stats)
+
+    #decodes a capture given in consecutive chunks of (time, ch1, ch2) (e.g. a long recording read in blocks)
+    #the samples after the last decoded frame are kept for the next chunk, a chunk that does not follow the previous one starts a new capture
+    def stream(self, chunks, stats=None):
+        time = ch1 = ch2 = None
+        idle_since = -np.inf
+        for chunk_time, chunk_ch1, chunk_ch2 in chunks:
+            chunk_time = np.asarray(chunk_time)
+            if chunk_time.shape[0] == 0:
+                continue
+            step = chunk_time[1] - chunk_time[0] if chunk_time.shape[0] > 1 else 0
+            if time is None or not (0 < chunk_time[0] - time[-1] <= 2*step):
+                if stats is not None:
+                    stats.discontinuity()
+                    stats.observe(chunk_time[-1] - chunk_time[0])
+                time, ch1, ch2 = chunk_time, np.asarray(chunk_ch1), np.asarray(chunk_ch2)
+                idle_since = -np.inf
+            else:
+                if stats is not None:
+                    stats.observe(chunk_time[-1] - time[-1])
+                time, ch1, ch2 = np.concatenate((time, chunk_time)), np.concatenate((ch1, chunk_ch1)), np.concatenate((ch2, chunk_ch2))
+            self.load(time, ch1, ch2, idle_since)
+            for packet in self.frames(stats):
+                yield packet
+            #keep the samples that were not decoded yet
+            idle_since = self.resume_idle_since
+            time, ch1, ch2 = time[self.resume_index:], ch1[self.resume_index:], ch2[self.resume_index:]
+
+    #initializes the decoding of a capture
+    #idle_since: time since which the bus is recessive at the start of the capture (-inf: the bus is considered idle)
+    def load(self, time, ch1, ch2, idle_since=-np.inf):
         #initialize variables
-        self.time = time
+        self.time = np.asarray(time)
         self.ch1 = ch1
         self.ch2 = ch2
+        #bus state of every sample, thresholded once (0: dominant, 1: recessive)
+        self.state = np.where(np.abs(np.asarray(ch1) - np.asarray(ch2)) > self.diff_threshold, 0, 1).astype(np.int8)
+        #indices of all the edges (first sample of the new state)
+        changes = np.flatnonzero(self.state[1:] != self.state[:-1]) + 1
+        self.rising_edges = changes[self.state[changes] == 0]     #recessive to dominant
+        self.falling_edges = changes[self.state[changes] == 1]    #dominant to recessive
+        #time of the recessive to dominant edges, between the last recessive sample and the first dominant one
+        self.rising_times = (self.time[self.rising_edges-1] + self.time[self.rising_edges])/2
+        #start of the recessive period before each rising edge, the starts of frame are the rising edges after the bus was idle
+        previous = np.searchsorted(self.falling_edges, self.rising_edges) - 1
+        recessive_since = np.where(previous >= 0, self.time[self.falling_edges[np.maximum(previous, 0)]], idle_since)
+        idle = self.time[self.rising_edges] - recessive_since >= self.idle_bits/self.std_bitrate
+        self.start_edges = self.rising_edges[idle]
+        self.start_times = self.rising_times[idle]
+        self.start_idle_since = recessive_since[idle]
+        self.idle_since = idle_since
         self.seek_index = 0
-        self.seek_time = time[0]
+        self.seek_time = self.time[0]
+        self.frame_start = 0    #position of the current frame in the buffer
         self.buffer = []
         self.buffer_time = []   #stores at which timesteps the samples in the buffer where taken
         self.edges_time = []    #stores the times of edges
-        packet = {}
 
-        #sample sync bit
-        self.seek_edge()
-        self.seek_sample(self.sample_point/(self.std_bitrate))
-        packet["sync"] = self.buffer[-1]
-
-        #sample 11 bits identifier
-        packet["identifier"] = ""
-        for i in range(11):
-            self.seek_sample_unstuffed(1/(self.std_bitrate))
-            packet["identifier"] += str(self.buffer[-1])
-        
-        #sample RTR, IDE, FDF, BRS bits
-        self.seek_sample_unstuffed(1/(self.std_bitrate))
-        packet["RTR"] = self.buffer[-1]
-        self.seek_sample_unstuffed(1/(self.std_bitrate))
-        packet["IDE"] = self.buffer[-1]
-        self.seek_sample_unstuffed(1/(self.std_bitrate))
-        packet["FDF"] = self.buffer[-1]
-        self.seek_sample_unstuffed(1/(self.std_bitrate))
-        packet["res"] = self.buffer[-1]
-        self.seek_sample_unstuffed(1/(self.std_bitrate))
-        packet["BRS"] = self.buffer[-1]
-
-        #look for ESI indicator
-        self.seek_sample(self.sample_point/(self.fd_bitrate))
-        packet["ESI"] = self.buffer[-1]
-
-        #sample data lenght code (4 bits)
-        packet["DLC"] = ""
-        for i in range(4):
-            self.seek_sample_unstuffed(1/(self.fd_bitrate))
-            packet["DLC"] += str(self.buffer[-1])
-
-        #sample the data frame
-        packet["Data"] = ""
-        for i in range(self.dlc_fd_map[int(packet["DLC"], 2)] * 8):
-            self.seek_sample_unstuffed(1/(self.fd_bitrate))
-            packet["Data"] += str(self.buffer[-1])
-
-        #sample fixed stuffed bit
-        self.seek_sample(1/(self.fd_bitrate))
-
-        #sample the bit stuffing + its parity
-        packet["StuffCount"] = ""
-        for i in range(3):
-            self.seek_sample(1/(self.fd_bitrate))
-            packet["StuffCount"] += str(self.buffer[-1])
-        self.seek_sample(1/(self.fd_bitrate))
-        packet["StuffCountParity"] = self.buffer[-1]
-
-        #sample the CRC
-        packet["CRC"] = ""
-        for i in range(26 if len(packet["Data"]) > 8*16 else 22):
-            self.seek_sample(1/(self.fd_bitrate))
-            #ignore the fixed stuff bits of the CRC
-            if i%5 != 0:
-                packet["CRC"] += str(self.buffer[-1])
-
-        #sample the CRC delimiter
-        self.seek_sample(1/(self.fd_bitrate))
-        packet["CRCdelim"] = self.buffer[-1]
+    #iterator of the frames of the loaded capture
+    #once done, resume_index and resume_idle_since tell from where the decoding must continue if more samples come (see stream)
+    def frames(self, stats=None):
+        while True:
+            position = np.searchsorted(self.start_edges, self.seek_index, side="left")
+            if position >= self.start_edges.shape[0]:
+                break
+            start = int(self.start_edges[position])
+            self.seek_index = start
+            self.seek_time = self.start_times[position]
+            self.edges_time.append(self.seek_time)
+            try:
+                packet = self.decode_frame()
+            except IncompleteFrame:
+                #decode this frame again once the next samples are there
+                self.resume_index = start - 1
+                self.resume_idle_since = self.start_idle_since[position]
+                return
+            except FrameError:
+                if stats is not None:
+                    stats.errors += 1
+                self.seek_index = start + 1
+                continue
+            if stats is not None:
+                stats.record(packet)
+            self.seek_index = max(self.seek_index, int(np.searchsorted(self.time, packet["end"], side="left")))
+            yield packet
+        #nothing left to decode: keep the last sample and the start of the current recessive period
+        self.resume_index = self.time.shape[0] - 1
+        if self.falling_edges.shape[0] > 0:
+            self.resume_idle_since = self.time[self.falling_edges[-1]]
+        else:
+            self.resume_idle_since = self.idle_since
 
-        print("===== Decoded bytes =====")
-        self.print_packet(packet)
-        print("===== Raw bit buffer =====")
-        print(self.buffer)
+    #decodes the frame starting at the current seek point (start of frame edge), the fields are read following frame_fields
+    #the packet also contains the "start" and "end" times of the frame (end of the end of frame field), the full identifier "ID"
+    #and the results of the checks: "CRCvalid" and "StuffCountValid" (FD frames)
+    def decode_frame(self):
+        self.frame_start = len(self.buffer)
+        packet = {"start": self.seek_time}
+        self.set_phase(False)
+        self.delay = self.sample_point/self.std_bitrate     #time from the start of frame edge to the first sampling point
+        self.last_bit = None
+        self.run = 0                #number of identical bits in the dynamically stuffed fields
+        self.stuff_count = 0        #number of dynamic stuff bits
+        self.fixed_count = 0        #number of bits in the fields with fixed stuff bits
+        #bits covered by the CRC, accumulated as integers: with the dynamic stuff bits (FD frames) and without (classic frames)
+        self.crc_stuffed = self.crc_stuffed_bits = 0
+        self.crc_destuffed = self.crc_destuffed_bits = 0
+
+        field = "sync"
+        while field is not None:
+            bits, stuffing, next_field = frame_fields[field]
+            if callable(bits):
+                bits = bits(self, packet)
+            if callable(stuffing):
+                stuffing = stuffing(self, packet)
+            if field == "CRC":
+                expected_crc = self.expected_crc(packet)
+            value = 0
+            for i in range(bits):
+                value = value << 1 | self.read_bit(stuffing)
+            packet[field] = value
+            if field == "sync" and value != 0:
+                raise FrameError("No start of frame")
+            if field in ("CRCdelim", "ACKdelim") and value != 1:
+                raise FrameError("{0} not recessive".format(field))
+            #the bit rate switches at the sampling point of the BRS bit and back at the one of the CRC delimiter
+            if field == "BRS" and value == 1:
+                self.set_phase(True)
+            elif field == "CRCdelim":
+                self.set_phase(False)
+            elif field == "CRC":
+                packet["CRCvalid"] = value == expected_crc
+            elif field == "StuffCountParity":
+                #number of dynamic stuff bits modulo 8 in gray code, with an even parity bit
+                packet["StuffCountValid"] = (packet["StuffCount"] == gray_codes[self.stuff_count % 8] and
+                                             value == bin(packet["StuffCount"]).count("1") % 2)
+            field = next_field(self, packet)
+
+        packet["Data"] = packet["Data"].to_bytes(self.data_length(packet), "big") if "Data" in packet else b""
+        packet["ID"] = packet["identifier"] << 18 | packet["identifier_ext"] if packet["IDE"] else packet["identifier"]
+        packet["end"] = self.seek_time + (1-self.sample_point)/self.std_bitrate + 7/self.std_bitrate
         return packet
-    
+
+    #reads the next bit of the frame, skipping and checking the stuff bits
+    #stuffing: "dynamic", "fixed" or None (see frame_fields)
+    def read_bit(self, stuffing):
+        #after 5 identical bits, the next one is a stuff bit (also after the last bit of the dynamically stuffed fields)
+        if self.run == 5:
+            bit = self.sample_bit()
+            if bit == self.last_bit:
+                self.stuff_error()
+            self.stuff_count += 1
+            self.crc_stuffed = self.crc_stuffed << 1 | bit
+            self.crc_stuffed_bits += 1
+            self.last_bit = bit
+            self.run = 1
+        if stuffing == "fixed":
+            self.run = 0
+            #fixed stuff bit before the stuff count and then every 4 bits
+            if self.fixed_count % 4 == 0:
+                bit = self.sample_bit()
+                if bit == self.last_bit:
+                    self.stuff_error()
+                self.last_bit = bit
+            self.fixed_count += 1
+        bit = self.sample_bit()
+        if stuffing == "dynamic":
+            self.run = self.run + 1 if bit == self.last_bit else 1
+            self.crc_destuffed = self.crc_destuffed << 1 | bit
+            self.crc_destuffed_bits += 1
+        elif stuffing is None:
+            self.run = 0
+        if stuffing is not None:
+            self.crc_stuffed = self.crc_stuffed << 1 | bit
+            self.crc_stuffed_bits += 1
+        self.last_bit = bit
+        return bit
+
+    def stuff_error(self):
+        if self.verbose:
+            print(self.buffer[self.frame_start:])
+        raise FrameError("Bit suffing not respected")
+
+    #number of bytes of data
+    def data_length(self, packet):
+        if packet["FDF"]:
+            return self.dlc_fd_map[packet["DLC"]]
+        #classic remote frames have no data
+        if (packet["RTR_ext"] if packet["IDE"] else packet["RTR"]) == 1:
+            return 0
+        return min(packet["DLC"], 8)
+
+    #CRC-15 for the classic frames, CRC-17 for the FD frames up to 16 bytes of data, CRC-21 above
+    def crc_width(self, packet):
+        if not packet["FDF"]:
+            return 15
+        return 17 if self.data_length(packet) <= 16 else 21
+
+    #CRC computed on the received bits (called before reading the CRC field)
+    def expected_crc(self, packet):
+        width = self.crc_width(packet)
+        if width == 15:
+            return crc(self.crc_destuffed, self.crc_destuffed_bits, width)
+        #the CRC of the FD frames includes the dynamic stuff bits and the stuff count, and starts with the most significant bit set
+        return crc(self.crc_stuffed, self.crc_stuffed_bits, width, 1 << (width-1))
+
     #print what was returned by parse()
     def print_packet(self, packet):
         for key in packet:
-            if type(packet[key]) is str:
-                print("{0}: {1} , {2}".format(key, hex(int(packet[key], 2)),packet[key]))
+            if type(packet[key]) is bytes:
+                print("{0}: {1}".format(key, packet[key].hex()))
+            elif key == "ID" or (key in frame_fields and frame_fields[key][0] != 1):
+                print("{0}: {1} , {2:b}".format(key, hex(packet[key]), packet[key]))
             else:
                 print("{0}: {1}".format(key, packet[key]))
 
-    #advances the seek point on the next edge
+    #advances the seek point on the next edge (after the sample before the current seek point)
     def seek_edge(self, type="rising"):
-        last_state = 0 if abs(self.ch1[max(0,self.seek_index-1)] - self.ch2[max(0,self.seek_index-1)]) > self.diff_threshold else 1
-        for i in range(max(0,self.seek_index-1), self.time.shape[0]):
-            state = 0 if abs(self.ch1[i] - self.ch2[i]) > self.diff_threshold else 1
-            if type=="rising" and state==0 and state!=last_state:
-                self.seek_index = i
-                self.seek_time = self.time[i]
-                self.edges_time.append(self.seek_time)
-                return
-            elif type=="falling" and state==1 and state!=last_state:
-                self.seek_index = i
-                self.seek_time = self.time[i]
-                self.edges_time.append(self.seek_time)
-                return
-            last_state = state
+        edges = self.rising_edges if type=="rising" else self.falling_edges
+        position = np.searchsorted(edges, max(0,self.seek_index-1), side="right")
+        if position < edges.shape[0]:
+            self.seek_index = int(edges[position])
+            #the edge is between the last sample before it and the first one after
+            self.seek_time = (self.time[self.seek_index-1] + self.time[self.seek_index])/2
+            self.edges_time.append(self.seek_time)
+
+    #bit timing of the arbitration phase or of the data phase
+    def set_phase(self, data):
+        self.rate = self.fd_bitrate if data else self.std_bitrate
+        self.phase_sample_point = self.fd_sample_point if data else self.sample_point
+        self.phase_sjw = self.fd_sjw if data else self.sjw
+
+    #sample the bit at the next sampling point: one bit time after the previous one at the current bit rate,
+    #moved by the phase error of the recessive to dominant edge at the start of the bit (limited to the resynchronization jump width)
+    #like a CAN controller, so that the clock differences do not accumulate along the frame
+    def sample_bit(self):
+        if self.delay is not None:
+            bit = self.seek_sample(self.delay)
+            self.delay = None
+            return bit
+        period = 1/self.rate
+        delay = period
+        if self.phase_sjw > 0:
+            #first edge between the previous sampling point and this one (a later edge is an early edge of the next bit)
+            position = np.searchsorted(self.rising_edges, self.seek_index, side="right")
+            jump = self.phase_sjw*period
+            if position < self.rising_edges.shape[0] and self.rising_times[position] <= self.seek_time + period:
+                #the edge is expected at the end of the previous bit
+                error = self.rising_times[position] - (self.seek_time + (1-self.phase_sample_point)*period)
+                delay += min(max(error, -jump), jump)
+        return self.seek_sample(delay)
 
-    #sample the bit time_delta after the current seek point, return False if it is a stuffed bit
+    #sample the bit time_delta after the current seek point
     def seek_sample(self, time_delta):
-        for i in range(max(0,self.seek_index-1), self.time.shape[0]):
-            if self.time[i] > self.seek_time + time_delta:
-                self.seek_index = i
-                self.seek_time += time_delta
-                self.buffer.append(0 if abs(self.ch1[i] - self.ch2[i]) > self.diff_threshold else 1)
-                self.buffer_time.append(self.seek_time)
-                #don't save the bit if it's a stuffed bit
-                if len(self.buffer) >= 6:
-                    #the last 5 bits are the same
-                    if len(set(self.buffer[-6:-1])) == 1:
-                        return False
-                return True
-    
-    #sample the bit time_delta after the current seek point, ignores stuffed bits
-    def seek_sample_unstuffed(self, time_delta):
-        if not self.seek_sample(time_delta):
-            if not self.seek_sample(time_delta):
-                print(self.buffer)
-                raise Exception("Bit suffing not respected")
\ No newline at end of file
+        #sample the closest to the sampling time (the time array is sorted)
+        i = int(np.searchsorted(self.time, self.seek_time + time_delta, side="right"))
+        if i >= self.time.shape[0]:
+            raise IncompleteFrame("End of the capture")
+        if i > 0 and self.seek_time + time_delta - self.time[i-1] < self.time[i] - (self.seek_time + time_delta):
+            i -= 1
+        self.seek_index = i
+        self.seek_time += time_delta
+        self.buffer.append(int(self.state[i]))
+        self.buffer_time.append(self.seek_time)
+        return self.buffer[-1]
@@ -8,8 +8,10 @@ import pyvisa as visa
 import numpy as np
 
 #Class used to retrieve the Tektronix TDS2022B oscilloscope readings
+#the waveform transfer is configured once and the scaling of each channel (preamble) is cached until the oscilloscope settings change
 class Oscilloscope:
-    def __init__(self, address):
+    #byte_count: 1 or 2 bytes per sample
+    def __init__(self, address, byte_count=1):
         self.rm = visa.ResourceManager()
         self.scope = self.rm.open_resource(address)
         self.scope.timeout = 5000
@@ -18,6 +20,9 @@ class Oscilloscope:
         self.scope.write_termination = None
         self.scope.write("*cls")
         print("opened: " + self.scope.query("*idn?"))
+        self.channels = (1, 2)          #channels of the oscilloscope
+        self.check_settings = True      #query the settings before each acquisition to know if the cached scaling is still valid
+        self.configure(byte_count)
 
     def __del__(self):
         self.scope.close()
@@ -27,53 +32,85 @@ class Oscilloscope:
         self.scope.close()
         self.rm.close()
 
+    #configures the waveform transfer: binary, whole record, 1 or 2 bytes per sample (the scaling is queried again)
+    def configure(self, byte_count=1):
+        self.byte_count = byte_count
+        self.record = int(self.scope.query('header 0;:horizontal:recordlength?'))
+        self.scope.write('data:encdg SRIBINARY;:data:start 1;:data:stop {0};:wfmpre:byt_nr {1}'.format(self.record, byte_count))
+        self.preambles = {}         #channel -> [ymult, yzero, yoff, xincr, xzero]
+        self.settings = None
+
+    #the settings that change the scaling, in a single query
+    def query_settings(self):
+        return self.scope.query(";".join([":ch{0}:scale?;:ch{0}:position?;:ch{0}:probe?".format(channel) for channel in self.channels] +
+                                         [":horizontal:main:scale?;:horizontal:main:position?;:horizontal:recordlength?"]))
+
+    #forget the cached scaling if the settings changed since the last acquisition
+    def update_settings(self):
+        settings = self.query_settings()
+        if settings != self.settings:
+            record = int(settings.split(";")[-1])
+            if record != self.record:
+                self.configure(self.byte_count)
+            self.preambles = {}
+            self.settings = settings
+
+    #scaling factors of a channel: [volts / level, reference voltage, reference position (level), time / sample, time of the first sample]
+    def get_preamble(self, channel):
+        if channel not in self.preambles:
+            values = self.scope.query('data:source CH{0};:wfmpre:ymult?;:wfmpre:yzero?;:wfmpre:yoff?;:wfmpre:xincr?;:wfmpre:xzero?'.format(channel))
+            self.preambles[channel] = [float(value) for value in values.split(";")]
+        return self.preambles[channel]
+
+    #Returns the time values and the voltages of the channels (numpy float64 arrays): time, [wave of each channel]
+    #one query per channel when the settings did not change
+    def get_waves(self, channels=(1, 2)):
+        try:
+            if self.check_settings or self.settings is None:
+                self.update_settings()
+            waves = []
+            for channel in channels:
+                vscale, voff, vpos = self.get_preamble(channel)[:3]
+                #select the channel and retrieve the wave in the same query
+                bin_wave = self.scope.query_binary_values('data:source CH{0};:curve?'.format(channel), datatype='b' if self.byte_count == 1 else 'h',
+                                                          container=np.array)
+                #convert wave to voltages
+                waves.append((np.array(bin_wave, dtype='double') - vpos) * vscale + voff)
+            tscale, tstart = self.get_preamble(channels[0])[3:]
+            return np.linspace(tstart, tstart + tscale*self.record, num=self.record, endpoint=False), waves
+        except:
+            self.print_error()
+
     #Returns the voltage values from the oscilloscope (as a numpy float64 array)
     def get_wave(self, channel):
+        result = self.get_waves((channel,))
+        if result is not None:
+            return result[1][0]
+
+    #Returns the time values from the oscilloscope as a numpy array
+    #can be used with the result of get_wave for plotting
+    def get_time(self, channel=1):
         try:
-            self.scope.write('data:encdg SRIBINARY')
-            self.scope.write('data:source CH{0}'.format(channel)) # channel
-            self.scope.write('header 0')
-            self.scope.write('data:start 1')
-            record = int(self.scope.query('horizontal:recordlength?'))
-            self.scope.write('data:stop {0}'.format(record)) # last sample
-            self.scope.write('wfmpre:byt_nr 1') # 1 byte per sample
-            #retrieve wave
-            bin_wave = self.scope.query_binary_values('curve?', datatype='b', container=np.array)
-            # retrieve scaling factors
-            vscale = float(self.scope.query('wfmpre:ymult?')) # volts / level
-            voff = float(self.scope.query('wfmpre:yzero?')) # reference voltage
-            vpos = float(self.scope.query('wfmpre:yoff?')) # reference position (level)
-            #convert wave to voltages
-            unscaled_wave = np.array(bin_wave, dtype='double') # data type conversion
-            scaled_wave = (unscaled_wave - vpos) * vscale + voff
-            return scaled_wave
+            if self.check_settings or self.settings is None:
+                self.update_settings()
+            tscale, tstart = self.get_preamble(channel)[3:]
+            return np.linspace(tstart, tstart + tscale*self.record, num=self.record, endpoint=False)
         except:
-            print(" == Oscilloscope error == ")
-            r = int(self.scope.query('*esr?'))
-            print('event status register: 0b{:08b}'.format(r))
-            r = self.scope.query('allev?').strip()
-            print('all event messages: {}'.format(r))
+            self.print_error()
 
-    #Returns the time values from the oscilloscope as a numpy array 
-    #can be used with the result of get_wave for plotting
-    def get_time(self):
+    #starts a single sequence acquisition and waits until it is done (the oscilloscope triggered), timeout in ms
+    def single(self, timeout=10000):
+        self.scope.write('acquire:stopafter sequence;:acquire:state on')
+        previous_timeout = self.scope.timeout
+        self.scope.timeout = timeout
         try:
-            self.scope.write('data:encdg SRIBINARY')
-            self.scope.write('header 0')
-            self.scope.write('data:start 1')
-            record = int(self.scope.query('horizontal:recordlength?'))
-            self.scope.write('data:stop {0}'.format(record)) # last sample
-            self.scope.write('wfmpre:byt_nr 1') # 1 byte per sample
-            # retrieve scaling factors
-            tscale = float(self.scope.query('wfmpre:xincr?'))
-            tstart = float(self.scope.query('wfmpre:xzero?'))
+            self.scope.query('*opc?')
+        finally:
+            self.scope.timeout = previous_timeout
 
-            total_time = tscale*record
-            tstop = tstart + total_time
-            return np.linspace(tstart, tstop, num=record, endpoint=False)
-        except:
-            print(" == Oscilloscope error == ")
-            r = int(self.scope.query('*esr?'))
-            print('event status register: 0b{:08b}'.format(r))
-            r = self.scope.query('allev?').strip()
-            print('all event messages: {}'.format(r))
\ No newline at end of file
+    def print_error(self):
+        print(" == Oscilloscope error == ")
+        r = int(self.scope.query('*esr?'))
+        print('event status register: 0b{:08b}'.format(r))
+        r = self.scope.query('allev?').strip()
+        print('all event messages: {}'.format(r))
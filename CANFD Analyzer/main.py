@@ -6,7 +6,7 @@
 """
 
 from Oscilloscope import Oscilloscope
-from CANParser import CANFDParser
+from CANParser import CANFDParser, BusStats
 import sys
 import matplotlib.pyplot as plt
 import csv
@@ -26,9 +26,7 @@ if len(sys.argv) == 1:
     #opening the device, this ID can be found by right clicking the oscilloscope in Windows Device Manager --> properties --> Details --> Device instance path
     #The found path needs to be modified to the format found right below
     analyser = Oscilloscope("USB::0x0699::0x0369::C040262::INSTR")
-    ch1 = analyser.get_wave(1)
-    ch2 = analyser.get_wave(2)
-    time = analyser.get_time()
+    time, (ch1, ch2) = analyser.get_waves((1, 2))
 #get the readings from a file
 else:
     file = open(sys.argv[1], "r")
@@ -42,9 +40,14 @@ else:
     ch1 = np.array(ch1)
     ch2 = np.array(ch2)
 
-#Parse the readings
+#Parse the readings (every frame of the capture)
 canfd = CANFDParser()
-canfd.parse(time, ch1, ch2)
+stats = BusStats()
+for packet in canfd.parse_all(time, ch1, ch2, stats):
+    print("===== Frame at {0:.6f}s =====".format(packet["start"]))
+    canfd.print_packet(packet)
+for line in stats.report():
+    print(line)
 
 #Plot the oscilloscope waves with the sampling times and edges detected by the CANFD parser
 plt.plot(time, ch1)
@@ -3,29 +3,163 @@
  *
  *  Created on: Jan 21, 2025
  *      Author: Severin Konishi
+ *
+ * How to use:
+ * "python COMSpy.py"                       forwards between COM3 and COM4 and prints the bytes
+ * "python COMSpy.py -a COM3 -b COM4 -q"    same without printing the bytes (only the statistics at the end)
+ * "python COMSpy.py -o capture.cap"        also records the bytes to a capture file (see CaptureFile.py)
+ * "python COMSpy.py -d"                    decodes the radio transactions and prints their statistics every second instead of the bytes
 """
-import serial
+import argparse
+import bisect
+import queue
+import threading
 import time
+import serial
+from CaptureFile import CaptureWriter
+from RadioDecoder import TransactionDecoder, TransactionStats
 baudrate = 57600
 
-bus_one = serial.Serial('COM3', baudrate=baudrate)
-bus_two = serial.Serial('COM4', baudrate=baudrate)
+#pass-through latency histogram bucket upper bounds in microseconds (the last bucket is everything above)
+latency_buckets = [50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000]
+
+#Forwards the bytes of one direction: blocks until data comes in, then sends everything that is waiting in a single write
+#and hands the block to the logger (the forwarding never waits for the logging)
+class Forwarder(threading.Thread):
+    def __init__(self, source, destination, direction, log_queue, stop_event):
+        threading.Thread.__init__(self, daemon=True)
+        self.source = source
+        self.destination = destination
+        self.direction = direction      #0: first port to second port, 1: second port to first port
+        self.log_queue = log_queue
+        self.stop_event = stop_event
+
+    def run(self):
+        while not self.stop_event.is_set():
+            #the read timeout of the ports is short so that the stop event is checked regularly
+            data = self.source.read(1)
+            if len(data) == 0:
+                continue
+            received = time.monotonic_ns()
+            if self.source.in_waiting > 0:
+                data += self.source.read(self.source.in_waiting)
+            self.destination.write(data)
+            forwarded = time.monotonic_ns()
+            self.log_queue.put((received, self.direction, data, forwarded - received))
+
+#Pass-through latency of the spy (time between receiving a block and having written it to the other port)
+class LatencyStats:
+    def __init__(self):
+        self.blocks = 0
+        self.bytes = 0
+        self.total = 0              #sum of the latencies in ns
+        self.max = 0
+        self.histogram = [0]*(len(latency_buckets)+1)
+
+    def record(self, size, latency):
+        self.blocks += 1
+        self.bytes += size
+        self.total += latency
+        self.max = max(self.max, latency)
+        self.histogram[bisect.bisect_left(latency_buckets, latency/1000)] += 1
+
+    #upper bound of the bucket containing the given percentile (in us, None if it is in the last bucket)
+    def percentile(self, value):
+        count = 0
+        for i in range(len(self.histogram)):
+            count += self.histogram[i]
+            if count >= value/100*self.blocks:
+                return latency_buckets[i] if i < len(latency_buckets) else None
+        return None
+
+    def report(self):
+        if self.blocks == 0:
+            return "no data"
+        p99 = self.percentile(99)
+        return "{0} blocks, {1} bytes, latency mean {2:.0f}us, p99 {3}, max {4:.0f}us".format(self.blocks, self.bytes, self.total/self.blocks/1000,
+            "<={0}us".format(p99) if p99 is not None else ">{0}us".format(latency_buckets[-1]), self.max/1000)
+
+#Spy between two serial ports: one forwarder per direction and a background logger that prints the blocks and keeps the statistics
+class COMSpy:
+    def __init__(self, port_one, port_two, verbose=True):
+        self.buses = [serial.Serial(port_one, baudrate=baudrate, timeout=0.1), serial.Serial(port_two, baudrate=baudrate, timeout=0.1)]
+        self.verbose = verbose
+        self.stats = [LatencyStats(), LatencyStats()]
+        #functions called by the logger with each block (time in ns, direction, data), e.g. a capture file
+        self.sinks = []
+        self.log_queue = queue.Queue()
+        self.stop_event = threading.Event()
+        self.start_time = time.monotonic_ns()
+        self.forwarders = [Forwarder(self.buses[0], self.buses[1], 0, self.log_queue, self.stop_event),
+                           Forwarder(self.buses[1], self.buses[0], 1, self.log_queue, self.stop_event)]
+        self.logger = threading.Thread(target=self.log, daemon=True)
+
+    def start(self):
+        self.logger.start()
+        for forwarder in self.forwarders:
+            forwarder.start()
+
+    def log(self):
+        while True:
+            block = self.log_queue.get()
+            if block is None:
+                break
+            received, direction, data, latency = block
+            self.stats[direction].record(len(data), latency)
+            for sink in self.sinks:
+                sink(received, direction, data)
+            if self.verbose:
+                print("[{0:.6f}: {1}->{2}]: 0x{3}".format((received - self.start_time)/1e9, self.buses[direction].name, self.buses[1-direction].name, data.hex()))
+
+    #stop the forwarding, log the remaining blocks and close the ports
+    def stop(self):
+        self.stop_event.set()
+        for forwarder in self.forwarders:
+            forwarder.join()
+        self.log_queue.put(None)
+        self.logger.join()
+        for bus in self.buses:
+            bus.close()
+
+    def report(self):
+        return ["{0}->{1}: {2}".format(self.buses[i].name, self.buses[1-i].name, self.stats[i].report()) for i in range(2)]
 
-start = time.time()
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Forwards the bytes between two serial ports and prints them")
+    parser.add_argument("-a", "--port-one", default="COM3", help="serial port of the peripheral")
+    parser.add_argument("-b", "--port-two", default="COM4", help="serial port connected to the program (through com0com)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="do not print the bytes")
+    parser.add_argument("-o", "--output", help="capture file to record the bytes to")
+    parser.add_argument("--rotate", type=float, help="start a new capture file every ROTATE MB (for long captures)")
+    parser.add_argument("-d", "--decode", action="store_true", help="decode the radio transactions (the program is on the second port)")
+    args = parser.parse_args()
+
+    spy = COMSpy(args.port_one, args.port_two, not (args.quiet or args.decode))
+    if args.decode:
+        decoder = TransactionDecoder(request_direction=1)
+        decode_stats = TransactionStats()
+        def decode(time_ns, direction, data):
+            for transaction in decoder.feed(time_ns, direction, data):
+                decode_stats.record(transaction)
+        spy.sinks.append(decode)
+    capture = None
+    if args.output is not None:
+        capture = CaptureWriter(args.output, [bus.name for bus in spy.buses], None if args.rotate is None else int(args.rotate*1e6))
+        spy.sinks.append(capture.write)
+    spy.start()
     try:
         while(True):
-            #if there is a byte in the first COM buffer, print it to CMD and send it through the second COM port
-            if bus_one.in_waiting > 0:
-                data = bus_one.read()
-                bus_two.write(data)
-                print("[{0}: {1}->{2}]: 0x{3}".format(round((time.time()-start),2), bus_one.name, bus_two.name, data.hex()))
-            #if there is a byte in the second COM buffer, print it to CMD and send it through the first COM port
-            if bus_two.in_waiting > 0:
-                data = bus_two.read()
-                bus_one.write(data)
-                print("[{0}: {1}->{2}]: 0x{3}".format(round((time.time()-start),2), bus_two.name, bus_one.name, data.hex()))
+            time.sleep(1)
+            if args.decode:
+                print(decode_stats.interval_report(time.monotonic_ns()))
     except KeyboardInterrupt:
         print("Stopped")
-        bus_one.close()
-        bus_two.close()
\ No newline at end of file
+    spy.stop()
+    if capture is not None:
+        capture.close()
+        print("Capture written to {0}".format(", ".join(capture.files)))
+    for line in spy.report():
+        print(line)
+    if args.decode:
+        for line in decode_stats.address_report():
+            print(line)
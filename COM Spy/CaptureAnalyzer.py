@@ -0,0 +1,192 @@
+"""
+ * CaptureAnalyzer.py
+ * Offline analysis of long COMSpy captures: the radio transactions are decoded once and indexed by time and by register address,
+ * the index is cached next to the capture (".tx.npz") so that the next queries do not read the capture again
+ *
+ * How to use:
+ * "python CaptureAnalyzer.py capture.cap"                                          summary of the transactions per address
+ * "python CaptureAnalyzer.py capture.cap -a 0x110 -k w --start 10 --stop 20"       writes to 0x110 between 10 s and 20 s after the start
+ * "python CaptureAnalyzer.py capture.cap -a 0x201 --latency"                       round-trip time distribution of the transactions of 0x201
+ * "python CaptureAnalyzer.py capture_0000.cap capture_0001.cap -a 0x110 -o out.csv"   query over rotated files, exported to csv (or .npz)
+"""
+import argparse
+import os
+import zlib
+import numpy as np
+from CaptureFile import read_capture, read_header
+from RadioDecoder import TransactionDecoder
+
+#codes of the operations and status in the index arrays
+index_operations = ["r8", "r16", "r32", "w8", "w16", "w32", "sync"]
+index_status = ["ack", "nak", "timeout", "invalid"]
+
+#Decoded and indexed transactions of one capture (or of a list of rotated capture files)
+#columns: "time" (int64 ns since the start of the capture), "operation" and "status" (uint8 codes), "address" (int32, -1 for sync),
+#"value" (int64, -1 if unknown), "rtt" (int64 ns, -1 for timeouts)
+#index: "by_address" (transaction numbers sorted by address then time), "addresses" and "address_start" (first position of each address in by_address)
+class CaptureIndex:
+    def __init__(self, file_paths, request_direction=1):
+        self.file_paths = [file_paths] if isinstance(file_paths, str) else list(file_paths)
+        self.request_direction = request_direction
+        self.cache_path = self.file_paths[0] + ".tx.npz"
+        #the cached index is used if it was built from the same files
+        stats = [os.stat(file_path) for file_path in self.file_paths]
+        self.source = np.array([request_direction] + [value for stat in stats for value in (stat.st_size, stat.st_mtime_ns)] +
+                               [zlib.crc32(os.path.abspath(file_path).encode()) for file_path in self.file_paths], dtype=np.int64)
+        if not self.load():
+            self.build()
+            try:
+                self.save()
+            except OSError:
+                pass
+
+    def load(self):
+        if not os.path.exists(self.cache_path):
+            return False
+        with np.load(self.cache_path) as cache:
+            if not np.array_equal(cache["source"], self.source):
+                return False
+            self.columns = {key: cache[key] for key in ["time", "operation", "status", "address", "value", "rtt"]}
+            self.by_address = cache["by_address"]
+            self.addresses = cache["addresses"]
+            self.address_start = cache["address_start"]
+            self.start_ns = int(cache["start_ns"])
+        return True
+
+    #decode all the files (the decoder state continues from one rotated file to the next)
+    def build(self):
+        with open(self.file_paths[0], "rb") as file:
+            self.start_ns = read_header(file)["monotonic_start_ns"]
+        decoder = TransactionDecoder(self.request_direction)
+        transactions = []
+        time_ns = self.start_ns
+        for file_path in self.file_paths:
+            for time_ns, direction, data in read_capture(file_path):
+                transactions += decoder.feed(time_ns, direction, data)
+        #the requests still waiting at the end of the capture are timeouts
+        decoder.expire(time_ns + decoder.timeout + 1, transactions)
+        transactions.sort(key=lambda transaction: transaction["time"])
+        self.columns = {"time": np.array([transaction["time"] - self.start_ns for transaction in transactions], dtype=np.int64),
+                        "operation": np.array([index_operations.index(transaction["operation"]) for transaction in transactions], dtype=np.uint8),
+                        "status": np.array([index_status.index(transaction["status"]) for transaction in transactions], dtype=np.uint8),
+                        "address": np.array([-1 if transaction["address"] is None else transaction["address"] for transaction in transactions], dtype=np.int32),
+                        "value": np.array([-1 if transaction["value"] is None else transaction["value"] for transaction in transactions], dtype=np.int64),
+                        "rtt": np.array([-1 if transaction["rtt"] is None else transaction["rtt"] for transaction in transactions], dtype=np.int64)}
+        #stable sort: the transactions of one address stay sorted by time
+        self.by_address = np.argsort(self.columns["address"], kind="stable")
+        self.addresses, self.address_start = np.unique(self.columns["address"][self.by_address], return_index=True)
+
+    def save(self):
+        np.savez(self.cache_path, source=self.source, by_address=self.by_address, addresses=self.addresses, address_start=self.address_start,
+                 start_ns=self.start_ns, **self.columns)
+
+    #transaction numbers matching the filters, in time order
+    #start/stop: ns since the start of the capture, address: register address, operation: "r", "w" or an operation name, status: status name
+    def select(self, start=None, stop=None, address=None, operation=None, status=None):
+        if address is None:
+            numbers = np.arange(self.columns["time"].shape[0])
+            times = self.columns["time"]
+        else:
+            position = np.searchsorted(self.addresses, address)
+            if position >= self.addresses.shape[0] or self.addresses[position] != address:
+                return np.zeros(0, dtype=np.int64)
+            end = self.address_start[position+1] if position + 1 < self.addresses.shape[0] else self.by_address.shape[0]
+            numbers = self.by_address[self.address_start[position]:end]
+            times = self.columns["time"][numbers]
+        #time range by binary search (the times are sorted)
+        first = 0 if start is None else np.searchsorted(times, start, side="left")
+        last = times.shape[0] if stop is None else np.searchsorted(times, stop, side="right")
+        numbers = numbers[first:last]
+        if operation is not None:
+            if operation in ("r", "w"):
+                codes = [index_operations.index(name) for name in index_operations if name[0] == operation]
+            else:
+                codes = [index_operations.index(operation)]
+            numbers = numbers[np.isin(self.columns["operation"][numbers], codes)]
+        if status is not None:
+            numbers = numbers[self.columns["status"][numbers] == index_status.index(status)]
+        return numbers
+
+    #columns of the selected transactions
+    def query(self, **filters):
+        numbers = self.select(**filters)
+        return {key: self.columns[key][numbers] for key in self.columns}
+
+    #round-trip time distribution (ms) of the answered transactions matching the filters
+    def latency(self, percentiles=(50, 90, 99, 99.9), **filters):
+        rtt = self.columns["rtt"][self.select(**filters)]
+        rtt = rtt[rtt >= 0]/1e6
+        if rtt.shape[0] == 0:
+            return None
+        return {"count": rtt.shape[0], "mean": np.mean(rtt), "max": np.max(rtt), "percentiles": dict(zip(percentiles, np.percentile(rtt, percentiles)))}
+
+    #one line per address with its number of transactions, NAK and timeout counts and mean round-trip time
+    def summary(self):
+        lines = []
+        for i in range(self.addresses.shape[0]):
+            if self.addresses[i] < 0:
+                continue
+            numbers = self.select(address=int(self.addresses[i]))
+            status = self.columns["status"][numbers]
+            rtt = self.columns["rtt"][numbers]
+            rtt = rtt[rtt >= 0]
+            lines.append("{0}: {1} transactions, {2} NAK, {3} timeouts, mean rtt {4:.2f}ms".format(hex(self.addresses[i]), numbers.shape[0],
+                np.count_nonzero(status == index_status.index("nak")), np.count_nonzero(status == index_status.index("timeout")),
+                np.mean(rtt)/1e6 if rtt.shape[0] > 0 else 0))
+        return lines
+
+#write query results to a ";" separated file (same format as the robot logs) or to a .npz file
+def export(result, file_path):
+    if file_path.endswith(".npz"):
+        np.savez(file_path, **result)
+        return
+    with open(file_path, "w") as file:
+        file.write("time_ns;operation;address;value;status;rtt_ns\n")
+        for i in range(result["time"].shape[0]):
+            file.write("{0};{1};{2};{3};{4};{5}\n".format(result["time"][i], index_operations[result["operation"][i]],
+                "" if result["address"][i] < 0 else hex(result["address"][i]), "" if result["value"][i] < 0 else hex(result["value"][i]),
+                index_status[result["status"][i]], "" if result["rtt"][i] < 0 else result["rtt"][i]))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Queries the radio transactions of COMSpy captures")
+    parser.add_argument("captures", nargs="+", help="capture file(s), rotated files in order")
+    parser.add_argument("-a", "--address", help="register address")
+    parser.add_argument("-k", "--kind", help='operation: "r", "w" or r8, r16, r32, w8, w16, w32, sync')
+    parser.add_argument("-s", "--status", choices=index_status, help="status of the transactions")
+    parser.add_argument("--start", type=float, help="start time in seconds since the start of the capture")
+    parser.add_argument("--stop", type=float, help="stop time in seconds since the start of the capture")
+    parser.add_argument("--latency", action="store_true", help="print the round-trip time distribution of the selected transactions")
+    parser.add_argument("-o", "--output", help="export the selected transactions to a .csv or .npz file")
+    parser.add_argument("-r", "--request-direction", type=int, default=1, help="direction of the requests (1: from the second port of COMSpy)")
+    args = parser.parse_args()
+
+    index = CaptureIndex(args.captures, args.request_direction)
+    filters = {"start": None if args.start is None else int(args.start*1e9),
+               "stop": None if args.stop is None else int(args.stop*1e9),
+               "address": None if args.address is None else int(args.address, 0),
+               "operation": args.kind,
+               "status": args.status}
+    if all([value is None for value in filters.values()]) and not args.latency and args.output is None:
+        print("{0} transactions".format(index.columns["time"].shape[0]))
+        for line in index.summary():
+            print(line)
+    else:
+        result = index.query(**filters)
+        print("{0} transactions selected".format(result["time"].shape[0]))
+        if args.latency:
+            latency = index.latency(**filters)
+            if latency is None:
+                print("no answered transaction")
+            else:
+                print("rtt: mean {0:.2f}ms, max {1:.2f}ms, ".format(latency["mean"], latency["max"]) +
+                      ", ".join(["p{0:g} {1:.2f}ms".format(key, value) for key, value in latency["percentiles"].items()]))
+        if args.output is not None:
+            export(result, args.output)
+            print("Exported to {0}".format(args.output))
+        elif not args.latency:
+            for i in range(min(result["time"].shape[0], 20)):
+                print("[{0:.6f}] {1} {2} {3} {4}".format(result["time"][i]/1e9, index_operations[result["operation"][i]],
+                    "" if result["address"][i] < 0 else hex(result["address"][i]), "-" if result["value"][i] < 0 else hex(result["value"][i]),
+                    index_status[result["status"][i]]))
+            if result["time"].shape[0] > 20:
+                print("... (-o FILE to export all of them)")
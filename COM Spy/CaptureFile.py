@@ -0,0 +1,197 @@
+"""
+ * CaptureFile.py
+ * Binary capture files of COMSpy: every block of bytes forwarded by the spy with its monotonic timestamp in ns and its direction
+ *
+ * File format (little endian):
+ *   header: "COMSPY" magic, version (uint16), wall clock time at the start (int64 ns since epoch), monotonic time at the start (int64 ns),
+ *           then the names of the two ports (uint8 length + utf-8 string each)
+ *   records: monotonic timestamp (int64 ns), direction (uint8, 0: first port to second port, 1: second to first), length (uint16), bytes
+ *
+ * How to use:
+ * "python CaptureFile.py capture.cap"                      prints the capture as text
+ * "python CaptureFile.py capture.cap -f pcap -o out.pcap"  converts it to a pcap file (one packet per block, the first byte is the direction)
+"""
+import argparse
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+
+capture_magic = b"COMSPY"
+capture_version = 1
+header_struct = struct.Struct("<6sHqq")
+record_struct = struct.Struct("<qBH")
+#largest block in a record, the bigger blocks are split
+max_block = 0xFFFF
+
+#pcap export: nanosecond timestamps, link type "user 0" (the packets are [direction, bytes...])
+pcap_header = struct.Struct("<IHHiIII")
+pcap_record = struct.Struct("<IIII")
+pcap_magic_ns = 0xA1B23C4D
+pcap_linktype_user0 = 147
+
+#Writes the blocks of a capture from a background thread (the spy only queues them), with a large write buffer
+#rotate_size (optional): a new file is started once the current one is larger than this number of bytes,
+#the files are named like the given path with a number: capture.cap -> capture_0000.cap, capture_0001.cap...
+class CaptureWriter:
+    def __init__(self, file_path, names, rotate_size=None, buffer_size=1 << 20):
+        self.file_path = file_path
+        self.names = names
+        self.rotate_size = rotate_size
+        self.buffer_size = buffer_size
+        self.file_index = 0
+        self.files = []         #paths of the files written
+        self.queue = queue.Queue()
+        self.open_file()
+        self.thread = threading.Thread(target=self.work, daemon=True)
+        self.thread.start()
+
+    def open_file(self):
+        if self.rotate_size is None:
+            path = self.file_path
+        else:
+            root, extension = os.path.splitext(self.file_path)
+            path = "{0}_{1:04d}{2}".format(root, self.file_index, extension)
+            self.file_index += 1
+        self.file = open(path, "wb", buffering=self.buffer_size)
+        self.file.write(header_struct.pack(capture_magic, capture_version, time.time_ns(), time.monotonic_ns()))
+        for name in self.names:
+            name = name.encode("utf-8")[:255]
+            self.file.write(bytes([len(name)]) + name)
+        self.size = self.file.tell()
+        self.files.append(path)
+
+    #queue a block (same arguments as the COMSpy sinks)
+    def write(self, time_ns, direction, data):
+        self.queue.put((time_ns, direction, data))
+
+    def work(self):
+        while True:
+            block = self.queue.get()
+            if block is None:
+                break
+            time_ns, direction, data = block
+            for start in range(0, len(data), max_block):
+                chunk = data[start:start+max_block]
+                self.file.write(record_struct.pack(time_ns, direction, len(chunk)))
+                self.file.write(chunk)
+                self.size += record_struct.size + len(chunk)
+            if self.rotate_size is not None and self.size >= self.rotate_size:
+                self.file.close()
+                self.open_file()
+        self.file.close()
+
+    #write the remaining blocks and close the file
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+#header of a capture file: {"version", "wall_start_ns", "monotonic_start_ns", "names", "size"} (size: number of bytes of the header)
+def read_header(file):
+    data = file.read(header_struct.size)
+    if len(data) != header_struct.size:
+        raise(ValueError("{0}: not a capture file".format(file.name)))
+    magic, version, wall_start, monotonic_start = header_struct.unpack(data)
+    if magic != capture_magic:
+        raise(ValueError("{0}: not a capture file".format(file.name)))
+    if version != capture_version:
+        raise(ValueError("{0}: unsupported capture version {1}".format(file.name, version)))
+    names = []
+    for i in range(2):
+        length = file.read(1)[0]
+        names.append(file.read(length).decode("utf-8"))
+    return {"version": version, "wall_start_ns": wall_start, "monotonic_start_ns": monotonic_start, "names": names, "size": file.tell()}
+
+#iterate over the blocks of a capture file: (monotonic time in ns, direction, bytes)
+#a truncated last record (capture stopped abruptly) is ignored
+def read_capture(file_path):
+    with open(file_path, "rb") as file:
+        read_header(file)
+        while True:
+            data = file.read(record_struct.size)
+            if len(data) != record_struct.size:
+                return
+            time_ns, direction, length = record_struct.unpack(data)
+            block = file.read(length)
+            if len(block) != length:
+                return
+            yield (time_ns, direction, block)
+
+#load captures (one file or a list of rotated files) into numpy arrays:
+#"time" (int64 ns, monotonic), "direction" (uint8), "offset" and "length" (int64, position of the block in "data") of each block,
+#"data" (uint8, all the bytes) and "header" (header of the first file)
+def load_capture(file_paths):
+    #numpy is only needed to analyze the captures, not to record them
+    import numpy as np
+    if isinstance(file_paths, str):
+        file_paths = [file_paths]
+    times = []
+    directions = []
+    lengths = []
+    blocks = []
+    header = None
+    for file_path in file_paths:
+        with open(file_path, "rb") as file:
+            if header is None:
+                header = read_header(file)
+            else:
+                read_header(file)
+            content = file.read()
+        position = 0
+        while position + record_struct.size <= len(content):
+            time_ns, direction, length = record_struct.unpack_from(content, position)
+            position += record_struct.size
+            if position + length > len(content):
+                break
+            times.append(time_ns)
+            directions.append(direction)
+            lengths.append(length)
+            blocks.append(content[position:position+length])
+            position += length
+    length = np.array(lengths, dtype=np.int64)
+    offset = np.zeros(length.shape[0], dtype=np.int64)
+    if length.shape[0] > 0:
+        offset[1:] = np.cumsum(length)[:-1]
+    return {"time": np.array(times, dtype=np.int64),
+            "direction": np.array(directions, dtype=np.uint8),
+            "offset": offset,
+            "length": length,
+            "data": np.frombuffer(b"".join(blocks), dtype=np.uint8),
+            "header": header}
+
+#text export, same format as the COMSpy prints (time in seconds since the start of the capture)
+def export_text(file_path, output):
+    with open(file_path, "rb") as file:
+        header = read_header(file)
+    names = header["names"]
+    for time_ns, direction, data in read_capture(file_path):
+        output.write("[{0:.9f}: {1}->{2}]: 0x{3}\n".format((time_ns - header["monotonic_start_ns"])/1e9, names[direction], names[1-direction], data.hex()))
+
+#pcap export, the timestamps are converted to wall clock time
+def export_pcap(file_path, output_path):
+    with open(file_path, "rb") as file:
+        header = read_header(file)
+    offset = header["wall_start_ns"] - header["monotonic_start_ns"]
+    with open(output_path, "wb") as output:
+        output.write(pcap_header.pack(pcap_magic_ns, 2, 4, 0, 0, max_block + 1, pcap_linktype_user0))
+        for time_ns, direction, data in read_capture(file_path):
+            wall = time_ns + offset
+            output.write(pcap_record.pack(wall // 1000000000, wall % 1000000000, len(data) + 1, len(data) + 1))
+            output.write(bytes([direction]) + data)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Converts a COMSpy capture file to text or pcap")
+    parser.add_argument("capture", help="capture file")
+    parser.add_argument("-f", "--format", choices=["text", "pcap"], default="text", help="output format")
+    parser.add_argument("-o", "--output", help="output file (default: print the text, CAPTURE.pcap for pcap)")
+    args = parser.parse_args()
+
+    if args.format == "pcap":
+        export_pcap(args.capture, args.output if args.output is not None else os.path.splitext(args.capture)[0] + ".pcap")
+    elif args.output is None:
+        export_text(args.capture, sys.stdout)
+    else:
+        with open(args.output, "w") as output:
+            export_text(args.capture, output)
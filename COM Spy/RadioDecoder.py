@@ -0,0 +1,189 @@
+"""
+ * RadioDecoder.py
+ * Decodes the bytes between the Radio PC client and the USB radio dongle into register transactions (protocol of RadioClient.py)
+ *
+ * Requests: [opcode<<2 | address>>8, address & 0xFF, value (writes only)], 0xFF (ignored) and 0xAA (sync request)
+ * Responses: [0x06 (ACK), value (reads only)] or a single byte NAK, 0xAA for a sync request
+ *
+ * How to use:
+ * "python RadioDecoder.py capture.cap"         prints the statistics of the transactions of a COMSpy capture
+ * "python RadioDecoder.py capture.cap -v"      also prints every transaction
+"""
+import argparse
+import collections
+import threading
+from CaptureFile import read_capture, read_header
+
+ACK = 0x06
+SYNC = 0xAA
+#operation and value size of each opcode
+opcodes = {0x00: ("r8", 1), 0x01: ("r16", 2), 0x02: ("r32", 4), 0x04: ("w8", 1), 0x05: ("w16", 2), 0x06: ("w32", 4)}
+operation_sizes = {operation: size for operation, size in opcodes.values()}
+
+#Streaming decoder: the bytes of both directions are fed as they are forwarded, the requests wait in a queue until their response comes
+#(the responses come back in the order of the requests, even when the requests are pipelined)
+#each transaction is a dictionary: {"time": request time in ns, "operation": "r8".."w32" or "sync", "address", "value" (unsigned, None if unknown),
+#"status": "ack", "nak", "timeout" or "invalid", "rtt": round-trip time in ns (None for timeouts)}
+class TransactionDecoder:
+    def __init__(self, request_direction=1, timeout=1.0):
+        self.request_direction = request_direction  #direction of the requests in the capture (1: from the second port, the program side of COMSpy)
+        self.timeout = int(timeout*1e9)             #a request without response after this time (ns) is a timeout
+        self.frame = bytearray()                    #request being received
+        self.frame_time = 0
+        self.pending = collections.deque()          #requests waiting for their response
+        self.response = bytearray()                 #response being received
+        self.unexpected = 0                         #response bytes that do not belong to any request
+        self.ignored = 0                            #request bytes outside of the frames (e.g. 0xFF of the sync)
+
+    #feed a block of bytes, returns the list of transactions it completed
+    def feed(self, time_ns, direction, data):
+        done = []
+        self.expire(time_ns, done)
+        if direction == self.request_direction:
+            for byte in data:
+                self.request_byte(time_ns, byte)
+        else:
+            for byte in data:
+                self.response_byte(time_ns, byte, done)
+        return done
+
+    #the requests that waited too long for their response timed out
+    def expire(self, time_ns, done):
+        while len(self.pending) > 0 and len(self.response) == 0 and time_ns - self.pending[0]["time"] > self.timeout:
+            transaction = self.pending.popleft()
+            transaction["status"] = "timeout"
+            done.append(transaction)
+
+    def request_byte(self, time_ns, byte):
+        if len(self.frame) == 0:
+            if not (byte >> 2) in opcodes:
+                if byte == SYNC:
+                    self.pending.append({"time": time_ns, "operation": "sync", "address": None, "value": None, "status": None, "rtt": None})
+                else:
+                    self.ignored += 1
+                return
+            self.frame_time = time_ns
+        self.frame.append(byte)
+        operation, size = opcodes[self.frame[0] >> 2]
+        write = operation[0] == "w"
+        if len(self.frame) < 2 + (size if write else 0):
+            return
+        self.pending.append({"time": self.frame_time,
+                             "operation": operation,
+                             "address": (self.frame[0] & 0x03) << 8 | self.frame[1],
+                             "value": int.from_bytes(self.frame[2:], "little") if write else None,
+                             "status": None,
+                             "rtt": None})
+        self.frame = bytearray()
+
+    def response_byte(self, time_ns, byte, done):
+        if len(self.pending) == 0:
+            self.unexpected += 1
+            return
+        transaction = self.pending[0]
+        self.response.append(byte)
+        if transaction["operation"] == "sync":
+            transaction["status"] = "ack" if byte == SYNC else "invalid"
+        elif self.response[0] != ACK:
+            transaction["status"] = "nak"
+        else:
+            if transaction["operation"][0] == "r":
+                if len(self.response) < 1 + operation_sizes[transaction["operation"]]:
+                    return
+                transaction["value"] = int.from_bytes(self.response[1:], "little")
+            transaction["status"] = "ack"
+        transaction["rtt"] = time_ns - transaction["time"]
+        self.response = bytearray()
+        done.append(self.pending.popleft())
+
+#value at the given percentile (0-100) of a sorted list
+def percentile(sorted_values, value):
+    return sorted_values[min(int(round(value/100*(len(sorted_values)-1))), len(sorted_values)-1)]
+
+#Aggregated statistics of the decoded transactions: per interval (ops/s and latency percentiles) and per address (NAK and timeout rates)
+class TransactionStats:
+    def __init__(self):
+        self.lock = threading.Lock()    #the transactions are recorded by the COMSpy logger thread and the reports are made by the main thread
+        self.interval_rtts = []
+        self.interval_count = 0
+        self.interval_failed = 0
+        self.interval_start = None
+        self.addresses = {}             #address -> {"total", "ack", "nak", "timeout", "invalid", "rtt": sum of the round-trip times in ns}
+        self.total = 0
+
+    def record(self, transaction):
+        with self.lock:
+            if self.interval_start is None:
+                self.interval_start = transaction["time"]
+            self.total += 1
+            self.interval_count += 1
+            if transaction["rtt"] is not None and transaction["status"] == "ack":
+                self.interval_rtts.append(transaction["rtt"])
+            else:
+                self.interval_failed += 1
+            if transaction["address"] is None:
+                return
+            entry = self.addresses.get(transaction["address"])
+            if entry is None:
+                entry = {"total": 0, "ack": 0, "nak": 0, "timeout": 0, "invalid": 0, "rtt": 0}
+                self.addresses[transaction["address"]] = entry
+            entry["total"] += 1
+            entry[transaction["status"]] += 1
+            if transaction["rtt"] is not None:
+                entry["rtt"] += transaction["rtt"]
+
+    #one line with the statistics since the last call (time_ns: current time), the interval is reset
+    def interval_report(self, time_ns):
+        with self.lock:
+            if self.interval_start is None or time_ns <= self.interval_start:
+                return "no transactions"
+            rtts = sorted(self.interval_rtts)
+            line = "{0:.1f} ops/s, {1} failed".format(self.interval_count/((time_ns - self.interval_start)/1e9), self.interval_failed)
+            if len(rtts) > 0:
+                line += ", rtt p50 {0:.2f}ms p90 {1:.2f}ms p99 {2:.2f}ms".format(percentile(rtts, 50)/1e6, percentile(rtts, 90)/1e6, percentile(rtts, 99)/1e6)
+            self.interval_rtts = []
+            self.interval_count = 0
+            self.interval_failed = 0
+            self.interval_start = time_ns
+            return line
+
+    #one line per address, the most used first
+    def address_report(self):
+        with self.lock:
+            lines = []
+            for address in sorted(self.addresses, key=lambda address: -self.addresses[address]["total"]):
+                entry = self.addresses[address]
+                answered = entry["total"] - entry["timeout"]
+                lines.append("{0}: {1} transactions, NAK {2:.1f}%, timeout {3:.1f}%, mean rtt {4:.2f}ms".format(hex(address), entry["total"],
+                    100*entry["nak"]/entry["total"], 100*entry["timeout"]/entry["total"], entry["rtt"]/answered/1e6 if answered > 0 else 0))
+            return lines
+
+#one line describing a transaction
+def format_transaction(transaction, start_ns=0):
+    if transaction["operation"] == "sync":
+        return "[{0:.6f}] sync {1}".format((transaction["time"] - start_ns)/1e9, transaction["status"])
+    return "[{0:.6f}] {1} {2} {3} {4}{5}".format((transaction["time"] - start_ns)/1e9, transaction["operation"], hex(transaction["address"]),
+        "-" if transaction["value"] is None else hex(transaction["value"]), transaction["status"],
+        "" if transaction["rtt"] is None else " ({0:.2f}ms)".format(transaction["rtt"]/1e6))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Decodes the radio transactions of a COMSpy capture")
+    parser.add_argument("capture", help="capture file")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print every transaction")
+    parser.add_argument("-r", "--request-direction", type=int, default=1, help="direction of the requests (1: from the second port of COMSpy)")
+    args = parser.parse_args()
+
+    with open(args.capture, "rb") as file:
+        header = read_header(file)
+    decoder = TransactionDecoder(args.request_direction)
+    stats = TransactionStats()
+    time_ns = 0
+    for time_ns, direction, data in read_capture(args.capture):
+        for transaction in decoder.feed(time_ns, direction, data):
+            stats.record(transaction)
+            if args.verbose:
+                print(format_transaction(transaction, header["monotonic_start_ns"]))
+    print("{0} transactions, {1} unexpected response bytes, {2} bytes outside of the requests".format(stats.total, decoder.unexpected, decoder.ignored))
+    print(stats.interval_report(time_ns))
+    for line in stats.address_report():
+        print(line)
@@ -0,0 +1,134 @@
+"""
+ * LogAnalyzer.py
+ * Computes summary statistics of all the robot logs of a directory (in parallel) and writes them to one table
+ *
+ * How to use:
+ * "python LogAnalyzer.py logs_folder"                              analyzes all the logs of the folder and writes logs_folder/summary.csv
+ * "python LogAnalyzer.py logs_folder -o out.csv -j 4 -p 99"        same with another output file, 4 processes and the 99th power percentile
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import numpy as np
+from LogLib import LogFile
+
+#log file extensions that are analyzed (plain and compressed)
+log_extensions = (".csv", ".csv.gz", ".csv.zst")
+#a joint is considered idle if it did not move during the last X ms
+idle_window = 500
+
+#columns of the summary table
+summary_keys = ["log", "module", "duration_s", "energy_J", "power_mean_W", "power_peak_W", "power_pXX_W", "active_s", "idle_s", "range_of_motion_deg", "gait_frequency_Hz"]
+
+#duration (in ms) during which the joint was moving, the joint is active if it changed during the last "idle_window" ms
+def active_duration(time, joint):
+    changes = np.flatnonzero(np.diff(joint) != 0) + 1
+    if changes.shape[0] == 0:
+        return 0
+    #time of the last change before each sample
+    last_change = np.searchsorted(time[changes], time, side="right") - 1
+    active = (last_change >= 0) & (time - time[changes[np.maximum(last_change, 0)]] < idle_window)
+    return np.sum(np.diff(time)[active[:-1]])
+
+#frequency with the most energy in the joint motion (during the active part of the log)
+def gait_frequency(time, joint):
+    changes = np.flatnonzero(np.diff(joint) != 0)
+    if changes.shape[0] < 2:
+        return np.nan
+    time = time[changes[0]:changes[-1]+2]
+    joint = joint[changes[0]:changes[-1]+2]
+    #resample on a uniform time base (the logs are not always sampled regularly)
+    step = np.median(np.diff(time))
+    if step <= 0:
+        return np.nan
+    uniform_time = np.arange(time[0], time[-1], step)
+    uniform_joint = np.interp(uniform_time, time, joint)
+    spectrum = np.abs(np.fft.rfft(uniform_joint - np.mean(uniform_joint)))
+    frequencies = np.fft.rfftfreq(uniform_joint.shape[0], d=step/1000)
+    if spectrum.shape[0] < 2:
+        return np.nan
+    return frequencies[1 + np.argmax(spectrum[1:])]
+
+#compute the statistics of every module of one log, returns a list of rows of the summary table
+def analyze(file_path, percentile):
+    log = LogFile()
+    log.open(file_path)
+    data = log.read_columns()
+    time = data["time"]
+    rows = []
+    module = 0
+    while "joint{0}".format(module) in data:
+        joint = data["joint{0}".format(module)]
+        row = dict.fromkeys(summary_keys, np.nan)
+        row["log"] = os.path.basename(file_path)
+        row["module"] = module
+        row["duration_s"] = (time[-1] - time[0])/1000 if time.shape[0] > 0 else 0
+        if time.shape[0] > 1:
+            row["active_s"] = active_duration(time, joint)/1000
+            row["idle_s"] = row["duration_s"] - row["active_s"]
+            row["range_of_motion_deg"] = np.max(joint) - np.min(joint)
+            row["gait_frequency_Hz"] = gait_frequency(time, joint)
+            #power consumption (only in the logs of the real robot)
+            if "power{0}".format(module) in data:
+                power = data["power{0}".format(module)]
+                row["power_mean_W"] = np.mean(power)
+                row["power_peak_W"] = np.max(power)
+                row["power_pXX_W"] = np.percentile(power, percentile)
+                row["energy_J"] = np.sum(np.diff(time)*(power[1:]+power[:-1])/2)/1000
+            #the energy counter of the robot is used when it is there
+            if "energy{0}".format(module) in data:
+                energy = data["energy{0}".format(module)]
+                row["energy_J"] = energy[-1] - energy[0]
+        rows.append(row)
+        module += 1
+    return rows
+
+def analyze_task(task):
+    try:
+        return analyze(task[0], task[1])
+    except Exception as e:
+        print("[Error] {0}: {1}".format(task[0], e))
+        return []
+
+def format_value(value):
+    if isinstance(value, str):
+        return value
+    if np.isnan(value):
+        return ""
+    return "{0:.6g}".format(value)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summary statistics of all the robot logs of a directory")
+    parser.add_argument("directory", help="folder containing the .csv (or .csv.gz/.csv.zst) logs")
+    parser.add_argument("-o", "--output", help="summary table file (default: DIRECTORY/summary.csv)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of processes")
+    parser.add_argument("-p", "--percentile", type=float, default=95, help="power percentile to compute")
+    args = parser.parse_args()
+
+    output = args.output if args.output is not None else os.path.join(args.directory, "summary.csv")
+    files = sorted([os.path.join(args.directory, name) for name in os.listdir(args.directory) if name.endswith(log_extensions)])
+    files = [name for name in files if os.path.abspath(name) != os.path.abspath(output)]
+    if len(files) == 0:
+        print("No log found in {0}".format(args.directory))
+        sys.exit()
+    print("Analyzing {0} logs with {1} processes".format(len(files), args.jobs))
+
+    #each log is analyzed by a different process, the rows are kept in the order of the files
+    with multiprocessing.Pool(processes=args.jobs) as pool:
+        results = pool.map(analyze_task, [(name, args.percentile) for name in files])
+
+    #write the summary table (same format as the logs)
+    keys = [key.replace("XX", "{0:g}".format(args.percentile)) for key in summary_keys]
+    with open(output, "w") as file:
+        file.write(";".join(keys) + "\n")
+        for rows in results:
+            for row in rows:
+                file.write(";".join([format_value(row[key]) for key in summary_keys]) + "\n")
+    #print the table to the console
+    widths = [max(len(key), 10) for key in keys]
+    print("  ".join([keys[i].ljust(widths[i]) for i in range(len(keys))]))
+    for rows in results:
+        for row in rows:
+            print("  ".join([format_value(row[summary_keys[i]]).ljust(widths[i]) for i in range(len(keys))]))
+    print("Summary written to {0}".format(output))
@@ -1,9 +1,156 @@
 import re
+import os
+import io
+import bisect
+import gzip
+import zlib
 import numpy as np
+#zstd compression is optional
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+#first bytes of the supported compressed formats
+compression_magic = {"gzip": b"\x1f\x8b", "zstd": b"\x28\xb5\x2f\xfd"}
+#file extensions used to choose the compression of a new log
+compression_extensions = {".gz": "gzip", ".zst": "zstd"}
+
+#converters of the column types that can be declared in a schema
+schema_converters = {"int": int, "float": float, "str": str}
+
+def new_decompressor(kind):
+    if kind == "gzip":
+        return zlib.decompressobj(wbits=31)
+    if zstandard is None:
+        raise(Exception("zstd logs need the zstandard package (pip install zstandard)"))
+    return zstandard.ZstdDecompressor().decompressobj()
+
+def compress_block(kind, data):
+    if kind == "gzip":
+        return gzip.compress(data, mtime=0)
+    if zstandard is None:
+        raise(Exception("zstd logs need the zstandard package (pip install zstandard)"))
+    return zstandard.ZstdCompressor().compress(data)
+
+#Streaming decompression of a gzip/zstd file made of one or several members (frames for zstd)
+#Positions (tell/seek) are offsets in the decompressed data, the start of each member is kept as a checkpoint to restart the decompression from there when seeking
+class CompressedReader(io.RawIOBase):
+    def __init__(self, file_path, kind):
+        self.raw = open(file_path, "rb")
+        self.kind = kind
+        self.chunk_size = 1 << 16       #compressed bytes read from the disk at once
+        self.checkpoints = [(0, 0)]     #(decompressed offset, compressed offset) of the members found so far
+        self.restart(0, 0)
+
+    def close(self):
+        if not self.closed:
+            self.raw.close()
+        super().close()
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    #restart the decompression at the beginning of a member
+    def restart(self, position, compressed_position):
+        self.raw.seek(compressed_position)
+        self.decompressor = new_decompressor(self.kind)
+        self.input = b""                            #compressed bytes not yet given to the decompressor
+        self.input_offset = compressed_position     #offset of the first byte of self.input in the file
+        self.output = b""                           #decompressed bytes not yet returned
+        self.output_start = 0
+        self.position = position
+
+    #decompress the next chunk of the file, returns False at the end of the file
+    def fill(self):
+        if len(self.input) < 4:
+            self.input += self.raw.read(self.chunk_size)
+            if len(self.input) == 0:
+                return False
+        #the previous member is finished, a new one starts here
+        if self.decompressor.eof:
+            if not self.input.startswith(compression_magic[self.kind]):
+                return False #padding or garbage after the last member
+            self.decompressor = new_decompressor(self.kind)
+            checkpoint = (self.position + len(self.output) - self.output_start, self.input_offset)
+            if checkpoint[0] > self.checkpoints[-1][0]:
+                self.checkpoints.append(checkpoint)
+        self.output = self.output[self.output_start:] + self.decompressor.decompress(self.input)
+        self.output_start = 0
+        #keep what is after the end of the member for the next one
+        consumed = len(self.input) - (len(self.decompressor.unused_data) if self.decompressor.eof else 0)
+        self.input_offset += consumed
+        self.input = self.input[consumed:]
+        return True
+
+    def readinto(self, buffer):
+        while len(self.output) - self.output_start == 0:
+            if not self.fill():
+                return 0
+        n = min(len(buffer), len(self.output) - self.output_start)
+        buffer[:n] = self.output[self.output_start:self.output_start+n]
+        self.output_start += n
+        self.position += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            raise(io.UnsupportedOperation("cannot seek from the end of a compressed file"))
+        #restart from the closest member if it is closer than the current position
+        checkpoint = self.checkpoints[bisect.bisect_right(self.checkpoints, (offset, float("inf"))) - 1]
+        if offset < self.position or checkpoint[0] > self.position:
+            self.restart(checkpoint[0], checkpoint[1])
+        #decompress and drop the data until the requested position
+        skip = bytearray(1 << 16)
+        while self.position < offset:
+            if self.readinto(memoryview(skip)[:min(len(skip), offset - self.position)]) == 0:
+                break
+        return self.position
+
+#Streaming compression to a gzip/zstd file, the data is compressed by blocks that are written as independent members
+#so that the reader can restart the decompression at any block when seeking
+class CompressedWriter(io.RawIOBase):
+    def __init__(self, file_path, kind, block_size=1 << 20):
+        self.raw = open(file_path, "wb")
+        self.kind = kind
+        self.block_size = block_size
+        self.block = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.block += data
+        if len(self.block) >= self.block_size:
+            self.write_block()
+        return len(data)
+
+    def write_block(self):
+        if len(self.block) > 0:
+            self.raw.write(compress_block(self.kind, bytes(self.block)))
+            self.block = bytearray()
+
+    def close(self):
+        if not self.closed:
+            self.write_block()
+            self.raw.close()
+        super().close()
 
 class LogFile:
     def __init__(self):
         self.file_operation = False
+        self.index_interval = 1000  #number of rows between two entries of the time index
+        self.read_buffer_size = 1 << 18     #size of the read buffer in bytes
+        self.write_buffer_size = 1 << 20    #size of the write buffer in bytes (also the size of the compressed blocks)
+        self.write_batch_rows = 10000       #number of rows formatted at once by write_batch
 
     def __del__(self):
         if self.file_operation:
@@ -12,49 +159,322 @@ class LogFile:
     #call to open and read an existing file
     def open(self, file_path):
         if not self.file_operation:
-            self.file = open(file_path, "r")
+            self.file_path = file_path
+            #opened in binary mode so that file positions are real byte offsets (used by the time index)
+            with open(file_path, "rb") as file:
+                magic = file.read(4)
+            self.compression = None
+            for kind in compression_magic:
+                if magic.startswith(compression_magic[kind]):
+                    self.compression = kind
+            if self.compression is None:
+                self.file = open(file_path, "rb", buffering=self.read_buffer_size)
+            else:
+                #streaming decompression, the offsets are then positions in the decompressed data
+                self.file = io.BufferedReader(CompressedReader(file_path, self.compression), buffer_size=self.read_buffer_size)
             self.file_operation = "r"
-            line = (self.file.readline()).replace("\n", "")
+            line = self.file.readline().decode().rstrip("\r\n")
+            #the rows are split on the delimiter of the header (with a regex if the header mixes both)
+            self.delimiter = None if (";" in line and "," in line) else ("," if "," in line else ";")
             line = re.split(r';|,', line)
             self.state_keys = []
             self.event_keys = []
+            #column types and units, either from the header ("key:type:unit") or from a ".schema" file next to the log
+            self.schema = {}
             #recover the keys from the file header
-            if line[0] == "time": #check that the first key is time
-                for key in line[1:]:
+            if line[0].split(":")[0] == "time": #check that the first key is time
+                for key in line:
                     #event key
-                    if key[-1] == "@":
-                        self.event_keys.append(key[:-1])
+                    event = key[-1:] == "@"
+                    key = key[:-1] if event else key
+                    key = key.split(":")
+                    if len(key) > 1:
+                        self.declare(file_path, key[0], key[1], key[2] if len(key) > 2 else "")
+                    if key[0] == "time":
+                        continue
+                    if event:
+                        self.event_keys.append(key[0])
                     #state key
                     else:
-                        self.state_keys.append(key)
+                        self.state_keys.append(key[0])
+            self.load_schema(file_path + ".schema")
+            #one converter per column, the values are kept as strings if there is no schema
+            self.converters = []
+            for key in ["time"] + self.state_keys + self.event_keys:
+                if key in self.schema:
+                    self.converters.append(schema_converters[self.schema[key][0]])
+                else:
+                    self.converters.append(str)
+            self.columns = 1 + len(self.state_keys) + len(self.event_keys)
+            self.line_number = 1    #number of the last line read (for the error messages)
+            self.data_offset = self.file.tell()
+            self.index = None       #time index, built or loaded on the first seek
+            self.index_motion_keys = None
+            self.pending = None     #line read ahead by seek(), returned by the next read()
+
+    #read the column types and units of a ".schema" file (one "key;type;unit" line per column), the file is optional
+    def load_schema(self, schema_path):
+        if not os.path.exists(schema_path):
+            return
+        with open(schema_path, "r") as schema_file:
+            for line in schema_file:
+                values = line.rstrip("\n").split(";")
+                if len(values) < 2 or values[0] == "key":
+                    continue
+                self.declare(schema_path, values[0], values[1], values[2] if len(values) > 2 else "")
+
+    #add the type and unit of a column to the schema ({key: (type, unit)} when reading and writing), source is where it was declared (for the error message)
+    def declare(self, source, key, column_type, unit):
+        if not column_type in schema_converters:
+            raise(ValueError("{0}: unknown type {1} for {2}".format(source, column_type, key)))
+        self.schema[key] = (column_type, unit)
 
     #read the next variable values
     def read(self):
         if self.file_operation == "r":
-            data = {}
-            line = (self.file.readline()).replace("\n", "")
+            line = self.readline()
             if len(line) == 0:
                 return None #end of file
-            values = re.split(r';|,', line)
+            return self.parse(line)
+
+    #next line of the file without the line return (empty string at the end of the file)
+    def readline(self):
+        if self.pending is not None:
+            line = self.pending
+            self.pending = None
+            return line
+        self.line_number += 1
+        return self.file.readline().decode().rstrip("\r\n")
+
+    #split a row into its values, raises an error if the row does not have one value per column
+    def split(self, line):
+        values = line.split(self.delimiter) if self.delimiter is not None else re.split(r';|,', line)
+        #the rows written by LogFile end with a delimiter
+        if len(values) == self.columns + 1 and len(values[-1]) == 0:
+            values.pop()
+        if len(values) != self.columns:
+            raise(ValueError("{0} line {1}: expected {2} values, got {3}".format(self.file_path, self.line_number, self.columns, len(values))))
+        return values
+
+    #read all the remaining rows at once, returns a dictionary of numpy arrays with the time and the requested state keys (all of them by default)
+    def read_columns(self, keys=None):
+        if self.file_operation != "r":
+            return None
+        if keys is None:
+            keys = self.state_keys
+        positions = [0] + [1 + self.state_keys.index(key) for key in keys]
+        columns = [[] for i in positions]
+        while True:
+            line = self.readline()
+            if len(line) == 0:
+                break
+            values = self.split(line)
+            for i in range(len(positions)):
+                columns[i].append(values[positions[i]])
+        data = {"time": np.array(columns[0], dtype=float)}
+        for i in range(len(keys)):
+            data[keys[i]] = np.array(columns[i+1], dtype=float)
+        return data
+
+    #convert a line of the file into a dictionary of values
+    def parse(self, line):
+        data = {}
+        values = self.split(line)
+        converters = self.converters
+        try:
             #read the timestamp
-            data["time"] = values[0]
-            values = values[1:]
+            data["time"] = converters[0](values[0])
             #read the states
-            for i in range(len(self.state_keys)):
-                data[self.state_keys[i]] = values[i]
-            values = values[(len(self.state_keys)):]
+            for i in range(1, len(self.state_keys)+1):
+                data[self.state_keys[i-1]] = converters[i](values[i])
             #read the events
-            for i in range(len(self.event_keys)):
+            for i in range(len(self.state_keys)+1, self.columns):
                 if(len(values[i]) > 0):
-                    data[self.event_keys[i]] = values[i]
-            return data
+                    data[self.event_keys[i-len(self.state_keys)-1]] = converters[i](values[i])
+        except ValueError as e:
+            raise(ValueError("{0} line {1}: {2}".format(self.file_path, self.line_number, e)))
+        return data
+
+    # ===== Time index ===== #
+    # The index stores the time and byte offset of one row every "index_interval" rows, the last entry points to the end of the file.
+    # Each block of rows between two entries is also flagged as active if one of the motion keys changed inside of it.
+    # It is cached next to the log in a ".idx" file and rebuilt if the log or the motion keys changed.
+    # For compressed logs, the offsets are positions in the decompressed data and the ".idx" file also stores where each compressed member starts.
+
+    #build the time index or load it from the sidecar file
+    def load_index(self, motion_keys=None):
+        if self.file_operation != "r":
+            return
+        if motion_keys is None:
+            motion_keys = self.state_keys
+        self.index_motion_keys = list(motion_keys)
+        stat = os.stat(self.file_path)
+        header = "#index;{0};{1};{2};{3}".format(stat.st_size, stat.st_mtime_ns, self.index_interval, ",".join(motion_keys))
+        index_path = self.file_path + ".idx"
+        #try to reuse the cached index
+        if os.path.exists(index_path):
+            with open(index_path, "r") as index_file:
+                if index_file.readline().rstrip("\n") == header:
+                    self.index = {"time": [], "offset": [], "active": []}
+                    checkpoints = []
+                    for line in index_file:
+                        values = line.rstrip("\n").split(";")
+                        #start of a compressed member
+                        if values[0] == "#member":
+                            checkpoints.append((int(values[1]), int(values[2])))
+                            continue
+                        self.index["time"].append(float(values[0]))
+                        self.index["offset"].append(int(values[1]))
+                        self.index["active"].append(values[2] == "1")
+                    if self.compression is not None and len(checkpoints) > 0:
+                        self.file.raw.checkpoints = checkpoints
+                    return
+        self.build_index(motion_keys)
+        #cache the index, the log is still readable if the folder is read-only
+        try:
+            with open(index_path, "w") as index_file:
+                index_file.write(header + "\n")
+                #the members of a compressed log are all known after the index scan
+                if self.compression is not None:
+                    for checkpoint in self.file.raw.checkpoints:
+                        index_file.write("#member;{0};{1}\n".format(checkpoint[0], checkpoint[1]))
+                for i in range(len(self.index["time"])):
+                    index_file.write("{0};{1};{2}\n".format(self.index["time"][i], self.index["offset"][i], int(self.index["active"][i])))
+        except OSError:
+            pass
+
+    #scan the whole file once to build the time index
+    def build_index(self, motion_keys):
+        self.index = {"time": [], "offset": [], "active": []}
+        #column of each motion key in a row (time is the first column)
+        motion_columns = [1 + self.state_keys.index(key) for key in motion_keys if key in self.state_keys]
+        position = self.file.tell()
+        self.file.seek(self.data_offset)
+        offset = self.data_offset
+        last_motion = None
+        last_time = None
+        row = 0
+        line_number = self.line_number
+        self.line_number = 1
+        for line in self.file:
+            self.line_number += 1
+            if len(line.rstrip(b"\r\n")) == 0:
+                break
+            values = self.split(line.decode().rstrip("\r\n"))
+            last_time = float(values[0])
+            motion = [values[i] for i in motion_columns]
+            if row % self.index_interval == 0:
+                self.index["time"].append(last_time)
+                self.index["offset"].append(offset)
+                self.index["active"].append(False)
+            if (last_motion is not None) and (motion != last_motion):
+                self.index["active"][-1] = True
+            last_motion = motion
+            offset += len(line)
+            row += 1
+        #last entry to know when the last block stops
+        if last_time is not None:
+            self.index["time"].append(last_time)
+            self.index["offset"].append(offset)
+            self.index["active"].append(False)
+        self.file.seek(position)
+        self.line_number = line_number
+
+    #load the index if it was not built with these motion keys (the active flags depend on them)
+    def load_motion_index(self, motion_keys=None):
+        if self.index is None or self.index_motion_keys != list(self.state_keys if motion_keys is None else motion_keys):
+            self.load_index(motion_keys)
+
+    #move the read position to the first row with a time greater or equal to time_ms, returns the time of this row (None if end of file)
+    def seek(self, time_ms):
+        if self.file_operation != "r":
+            return None
+        if self.index is None:
+            self.load_index()
+        self.pending = None
+        #jump to the last indexed row strictly before the requested time (rows with the same time can be on both sides of an entry)
+        #and read forward from there, the last entry (end of file) is not a row
+        i = max(bisect.bisect_left(self.index["time"], time_ms, 0, max(len(self.index["time"]) - 1, 0)) - 1, 0)
+        self.file.seek(self.index["offset"][i] if len(self.index["offset"]) > 0 else self.data_offset)
+        #the indexed rows are every "index_interval" rows after the header
+        self.line_number = 1 + i*self.index_interval
+        while True:
+            line = self.readline()
+            if len(line) == 0:
+                return None
+            row_time = float(self.split(line)[0])
+            if row_time >= time_ms:
+                self.pending = line
+                return row_time
+
+    #read all the rows with a time in [start_ms, stop_ms[
+    def read_range(self, start_ms, stop_ms):
+        rows = []
+        if self.seek(start_ms) is None:
+            return rows
+        while True:
+            data = self.read()
+            if data is None or float(data["time"]) >= stop_ms:
+                break
+            rows.append(data)
+        return rows
 
+    #time of the first row where one of the motion keys changed (None if nothing moves in the file)
+    def first_motion(self, motion_keys=None):
+        self.load_motion_index(motion_keys)
+        for i in range(len(self.index["active"]) - 1):
+            if self.index["active"][i]:
+                #the change can happen on the first row of the block, start one block earlier to have the previous values
+                self.seek(self.index["time"][max(i-1, 0)])
+                keys = self.state_keys if motion_keys is None else motion_keys
+                last_motion = None
+                while True:
+                    data = self.read()
+                    if data is None:
+                        return None
+                    motion = [data[key] for key in keys if key in data]
+                    if (last_motion is not None) and (motion != last_motion):
+                        return float(data["time"])
+                    last_motion = motion
+        return None
 
+    #list of (start, stop) times of the stretches where none of the motion keys changed for at least min_duration_ms
+    #the spans are aligned on the index blocks so they can be slightly shorter than the real idle stretches
+    def idle_spans(self, min_duration_ms, motion_keys=None):
+        self.load_motion_index(motion_keys)
+        spans = []
+        start = None
+        for i in range(len(self.index["time"])):
+            #the last entry has no block, it closes the last span
+            active = self.index["active"][i] if i < len(self.index["time"]) - 1 else True
+            if not active and start is None:
+                start = self.index["time"][i]
+            elif active and start is not None:
+                if self.index["time"][i] - start >= min_duration_ms:
+                    spans.append((start, self.index["time"][i]))
+                start = None
+        return spans
 
     #call to create a new file to write to
-    def new(self, file_path, state_keys, event_keys):
+    #schema (optional): {key: (type, unit)} with type "int", "float" or "str", written to a ".schema" file next to the log
+    def new(self, file_path, state_keys, event_keys, schema=None):
         if not self.file_operation:
-            self.file = open(file_path, "w")
+            self.schema = {}
+            if schema is not None:
+                for key in schema:
+                    self.declare(file_path + ".schema", key, schema[key][0], schema[key][1])
+                with open(file_path + ".schema", "w") as schema_file:
+                    schema_file.write("key;type;unit\n")
+                    for key in ["time"] + state_keys + event_keys:
+                        if key in schema:
+                            schema_file.write("{0};{1};{2}\n".format(key, schema[key][0], schema[key][1]))
+            #large write buffer so that the rows are sent to the disk in big blocks
+            compression = compression_extensions.get(os.path.splitext(file_path)[1])
+            if compression is None:
+                self.file = open(file_path, "w", buffering=self.write_buffer_size)
+            else:
+                #".gz" and ".zst" logs are compressed by blocks while they are written
+                self.file = io.TextIOWrapper(io.BufferedWriter(CompressedWriter(file_path, compression, self.write_buffer_size), buffer_size=self.write_buffer_size))
             self.file_operation = "w"
             self.state_keys = state_keys[:]
             self.event_keys = event_keys[:]
@@ -73,14 +493,126 @@ class LogFile:
 
             #write to file only when the "time" key is present and all states have a value/are initialized
             if ("time" in data) and (len(self.states) == len(self.state_keys)):
-                #write the time
-                self.file.write(str(data["time"]) + ";")
-                #write the states
+                #time, states and events are all followed by a ";"
+                line = str(data["time"]) + ";"
                 for key in self.states:
-                    self.file.write(str(self.states[key]) + ";")
-                #write the events
+                    line += str(self.states[key]) + ";"
                 for key in self.event_keys:
                     if key in data:
-                        self.file.write(str(data[key]))
-                    self.file.write(";")
-                self.file.write("\n")
\ No newline at end of file
+                        line += str(data[key])
+                    line += ";"
+                self.file.write(line + "\n")
+
+    #write many rows at once, the output is the same as calling write() for each row
+    #time: N timestamps, states: N x len(state_keys) matrix (columns in the state_keys order), events: list of (row, key, value)
+    def write_batch(self, time, states, events=None):
+        if self.file_operation == "w":
+            if events is None:
+                events = []
+            #the timestamps keep their own type (e.g. an int 0 followed by float steps) so that they are written like by write()
+            time = time.tolist() if isinstance(time, np.ndarray) else list(time)
+            states = np.asarray(states).reshape(len(time), len(self.state_keys))
+            #format the rows by chunks to limit the memory used by the strings
+            for start in range(0, len(time), self.write_batch_rows):
+                stop = min(start + self.write_batch_rows, len(time))
+                #all the values of a column are converted to strings at once
+                columns = [[str(value) for value in time[start:stop]]]
+                for i in range(len(self.state_keys)):
+                    #the columns declared as int in the schema are written as int even if the matrix is float
+                    if self.schema.get(self.state_keys[i], ("",))[0] == "int":
+                        columns.append(states[start:stop, i].astype(int).astype(str).tolist())
+                    else:
+                        columns.append(states[start:stop, i].astype(str).tolist())
+                #the event columns are empty except for the rows that have an event
+                for key in self.event_keys:
+                    columns.append([""] * (stop-start))
+                for row, key, value in events:
+                    if start <= row < stop and key in self.event_keys:
+                        columns[1 + len(self.state_keys) + self.event_keys.index(key)][row-start] = str(value)
+                #time, states and events are all followed by a ";"
+                self.file.write("".join([";".join(values) + ";\n" for values in zip(*columns)]))
+            #keep the last states for the following write() calls, as python values so that they are written like in write_batch()
+            if len(time) > 0:
+                last = states[-1].tolist()
+                for i in range(len(self.state_keys)):
+                    if self.schema.get(self.state_keys[i], ("",))[0] == "int":
+                        last[i] = int(last[i])
+                    self.states[self.state_keys[i]] = last[i]
+
+    #write the buffered rows to the disk and close the file
+    def close(self):
+        if self.file_operation:
+            self.file.close()
+            self.file_operation = False
+
+#Multi-resolution min/max decimation of logged channels, used to plot long logs with a bounded number of points without hiding the spikes
+#Level 0 is the raw data, each next level keeps the min and max of "factor" consecutive points of the previous level
+class MinMaxPyramid:
+    def __init__(self, time, values, factor=8):
+        self.factor = factor
+        time = np.asarray(time, dtype=float)
+        values = np.asarray(values, dtype=float)
+        if values.ndim == 1:
+            values = values[:, np.newaxis]
+        #each level is (time of the first point of each bin, min of each bin, max of each bin)
+        self.levels = [(time, values, values)]
+        while self.levels[-1][0].shape[0] > factor:
+            time, low, high = self.levels[-1]
+            bins = (time.shape[0] + factor - 1)//factor
+            #the last bin is completed with its last value
+            padding = bins*factor - time.shape[0]
+            low = np.concatenate((low, np.repeat(low[-1:], padding, axis=0))).reshape(bins, factor, -1).min(axis=1)
+            high = np.concatenate((high, np.repeat(high[-1:], padding, axis=0))).reshape(bins, factor, -1).max(axis=1)
+            self.levels.append((time[::factor], low, high))
+
+    #points of all the channels between start and stop, taken from the finest level with at most max_points bins in the window
+    #returns (time, values) ready to be plotted, values has one column per channel
+    def get(self, start, stop, max_points=2000):
+        for time, low, high in self.levels:
+            first = max(np.searchsorted(time, start, side="right") - 1, 0)
+            last = np.searchsorted(time, stop, side="right") + 1
+            if last - first <= max_points:
+                break
+        if low is high:
+            return time[first:last], low[first:last]
+        #each bin is drawn as a vertical segment from its min to its max so that the spikes stay visible
+        values = np.empty((2*low[first:last].shape[0], low.shape[1]))
+        values[0::2] = low[first:last]
+        values[1::2] = high[first:last]
+        return np.repeat(time[first:last], 2), values
+
+    def save(self, file_path, source):
+        levels = {}
+        for i in range(len(self.levels)):
+            levels["time{0}".format(i)] = self.levels[i][0]
+            levels["low{0}".format(i)] = self.levels[i][1]
+            if i > 0:
+                levels["high{0}".format(i)] = self.levels[i][2]
+        np.savez(file_path, factor=self.factor, source=source, **levels)
+
+#min/max pyramid of the given state keys of a log, cached next to the log in a ".lod.npz" file
+def load_pyramid(file_path, keys, factor=8):
+    stat = os.stat(file_path)
+    source = np.array([stat.st_size, stat.st_mtime_ns, factor] + [zlib.crc32(key.encode()) for key in keys])
+    cache_path = file_path + ".lod.npz"
+    #reuse the cached pyramid if it was built from the same log and keys
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as cache:
+            if np.array_equal(cache["source"], source):
+                pyramid = MinMaxPyramid(np.zeros(0), np.zeros((0, len(keys))), factor)
+                pyramid.levels = []
+                i = 0
+                while "time{0}".format(i) in cache:
+                    low = cache["low{0}".format(i)]
+                    pyramid.levels.append((cache["time{0}".format(i)], low, cache["high{0}".format(i)] if i > 0 else low))
+                    i += 1
+                return pyramid
+    log = LogFile()
+    log.open(file_path)
+    data = log.read_columns(keys)
+    pyramid = MinMaxPyramid(data["time"], np.stack([data[key] for key in keys], axis=1) if len(keys) > 0 else np.zeros((data["time"].shape[0], 0)), factor)
+    try:
+        pyramid.save(cache_path, source)
+    except OSError:
+        pass
+    return pyramid
@@ -18,7 +18,7 @@ from CPG import *
 from CPP_CPG import *
 import threading
 import queue
-from LogLib import LogFile
+from LogLib import LogFile, load_pyramid
 
 #=========================== #
 #===== USER PARAMETERS ===== #
@@ -51,6 +51,11 @@ fps = 30                    # animation frames per seconds (higher is more expen
 speed = 1                   # animation speed multiplier (higher is more expensive)
 duration = 10               # animation duration in seconds
 
+# === Replay parameters (when reading from a log file) === #
+replay_jump_to_motion = False   # start the replay at the first joint movement (skips the wait before the joystick is pushed)
+replay_compress_idle = False    # shorten the stretches where the joints do not move
+replay_idle_gap = 2000          # idle stretches longer than X ms are shortened to X ms
+
 #============================#
 #===== GLOBAL VARIABLES =====#
 #============================#
@@ -68,10 +73,14 @@ cpg_ddr_history = None
 cpg_theta_history = None
 cpg_dtheta_history = None
 
-#Store all data for the consumption plots (and real-time plots)
+#Store the time and the consumption extremes of the log for the consumption plots (and real-time plots)
 time_history = []
-power_history = None
-energy_history = None
+power_max = 0
+energy_min = 0
+energy_max = 0
+#min/max pyramid of the consumption channels of the log file, only the points visible in the plot window are drawn
+lod = None
+lod_keys = []
 
 #User shell commands (Shell thread --> CPG thread)
 shell_queue = queue.Queue()
@@ -148,12 +157,30 @@ def cpg_thread():
                 break
             number_modules += 1
         print("Detected {0} modules".format(number_modules))
+        #the time index of the file is used to jump over the idle parts of the log
+        if replay_jump_to_motion or replay_compress_idle:
+            motion_keys = ["joint{0}".format(i) for i in range(number_modules)]
+            input_file.load_index(motion_keys)
+            idle_spans = input_file.idle_spans(replay_idle_gap, motion_keys) if replay_compress_idle else []
+            if replay_jump_to_motion:
+                first_motion = input_file.first_motion(motion_keys)
+                if first_motion is not None:
+                    input_file.seek(first_motion)
+                    print("Replay starts at the first motion ({0} ms)".format(first_motion))
 
     #create output log file (only if no input file)
     elif len(sys.argv) == 1 and file_save:
         now = datetime.now()
         output_file = LogFile()
-        output_file.new(now.strftime("exports/%d_%m_%Y_%H_%M_%S.csv"), ["joint{0}".format(i) for i in range(number_modules)], ["print"])
+        #the time is a float as soon as the integration step is not an int (t starts at 0 and is incremented by delta_ms)
+        schema = {"time": ("int" if isinstance(delta_ms, int) else "float", "ms"), "print": ("str", "")}
+        for i in range(number_modules):
+            schema["joint{0}".format(i)] = ("int", "deg")
+        output_file.new(now.strftime("exports/%d_%m_%Y_%H_%M_%S.csv"), ["joint{0}".format(i) for i in range(number_modules)], ["print"], schema)
+        #the steps are stored in buffers and written to the file in batches
+        save_time = []
+        save_joints = np.zeros((output_file.write_batch_rows, number_modules))
+        save_events = []
 
     #initialization
     robot_states = {"time": None, "joint": None, "energy": None, "power": None}
@@ -184,18 +211,25 @@ def cpg_thread():
 
                 #save to file if enabled
                 if len(sys.argv) == 1 and file_save:
-                    output_data = {}
-                    output_data["time"] = t
-                    for i in range(number_modules):
-                        output_data["joint{0}".format(i)] = str(int(np.rad2deg(joint_setpoints)[i]))
+                    save_joints[len(save_time)] = joint_setpoints
                     #add notification in the file that a CPG parameter was changed by the user
                     if shell_queue.qsize() > 0:
-                        output_data["print"] = shell_queue.get()
-                    output_file.write(output_data)
+                        save_events.append((len(save_time), "print", shell_queue.get()))
+                    save_time.append(t)
 
                 t += delta_ms
+                #end of the simulation (max duration reached or stopped by the user), read once so that the last batch is written and the file closed on the same step
+                done = t >= duration*1000 or user_stop
+                #write the saved steps to the file when the buffer is full or at the end of the simulation
+                if len(sys.argv) == 1 and file_save and (len(save_time) == save_joints.shape[0] or done):
+                    output_file.write_batch(save_time, np.rad2deg(save_joints[:len(save_time)]).astype(int), save_events)
+                    save_time = []
+                    save_events = []
+                    if done:
+                        output_file.close()
+
                 #stop the rendering if above the max simulation duration
-                if t >= duration*1000 or user_stop:
+                if done:
                     render_queue.put(None) #notify the main thread that the simulation is over
                     stop_cpg = True
                     stop_shell = True
@@ -235,6 +269,19 @@ def cpg_thread():
                 #grab next file entry to know until when the current states should be shown
                 raw_data = input_file.read()
 
+                #jump over the idle stretch if the next entry is inside of it (only "replay_idle_gap" ms of it are shown)
+                if replay_compress_idle and raw_data is not None:
+                    while len(idle_spans) > 0 and idle_spans[0][1] <= int(raw_data["time"]):
+                        idle_spans.pop(0)
+                    if len(idle_spans) > 0 and int(raw_data["time"]) >= idle_spans[0][0]:
+                        span = idle_spans.pop(0)
+                        input_file.seek(span[1])
+                        raw_data = input_file.read()
+                        if raw_data is not None:
+                            skipped = max(int(raw_data["time"]) - t - replay_idle_gap, 0)
+                            next_frame += skipped
+                            print("Skipped {0} ms of idle log".format(skipped))
+
                 #if end of file
                 if raw_data == None or user_stop:
                     #render the last frame
@@ -318,6 +365,31 @@ if len(sys.argv) == 2 and plot_energy:
         lines_energy.append(ax_energy.plot(np.zeros(1), np.zeros(1), label="joint {0}".format(i))[0])
     ax_energy.legend(loc="upper left")
 
+#Load (or build) the pyramid of the consumption channels of the log
+if len(sys.argv) == 2 and (plot_power or plot_energy):
+    header = LogFile()
+    header.open(sys.argv[1])
+    lod_keys = [key for key in ["power{0}".format(i) for i in range(number_modules)] + ["energy{0}".format(i) for i in range(number_modules)] if key in header.state_keys]
+    header.close()
+    lod = load_pyramid(sys.argv[1], lod_keys)
+    #the plot limits are the extremes of the whole log, given by the top level of the pyramid
+    lod_low, lod_high = lod.levels[-1][1], lod.levels[-1][2]
+    power_columns = [lod_keys.index(key) for key in lod_keys if key.startswith("power")]
+    energy_columns = [lod_keys.index(key) for key in lod_keys if key.startswith("energy")]
+    if len(power_columns) > 0:
+        power_max = np.max(lod_high[:, power_columns])
+    if len(energy_columns) > 0:
+        energy_min = np.min(lod_low[:, energy_columns])
+        energy_max = np.max(lod_high[:, energy_columns])
+
+#plot the level of the pyramid that matches the visible window of the axis (the "name" channels of all modules)
+def plot_lod(ax, lines, name):
+    start, stop = ax.get_xlim()
+    x, y = lod.get(start, stop)
+    for i in range(len(lines)):
+        if "{0}{1}".format(name, i) in lod_keys:
+            lines[i].set_data(x, y[:, lod_keys.index("{0}{1}".format(name, i))])
+
 #If there is live plotting
 if plot_robot_pose:
     #Give time to the user to rearange the matplotlib windows
@@ -352,17 +424,7 @@ while not stop_plot:
     robot_events = raw_queue[1]
     #joint data
     joint_setpoints = robot_states["joint"]
-    #power consumption data
     time_history.append(robot_states["time"])
-    if power_history is None:
-        power_history = np.array([robot_states["power"]])
-    else:
-        power_history = np.concatenate((power_history, np.array([robot_states["power"]])))
-    #energy consumption data
-    if energy_history is None:
-        energy_history = np.array([robot_states["energy"]])
-    else:
-        energy_history = np.concatenate((energy_history, np.array([robot_states["energy"]])))
     #CPG parameter update
     if not robot_events["print"] == None:
         print("[{0}]".format(robot_states["time"]) + robot_events["print"])
@@ -387,18 +449,14 @@ while not stop_plot:
         #power consumption live plotting
         if len(sys.argv) == 2 and plot_power:
             ax_power.set_xlim(time_history[-1]-plot_power_window, time_history[-1])
-            ax_power.set_ylim(0,np.max(power_history)+1)
-            for i in range(number_modules):
-                lines_power[i].set_xdata(time_history)
-                lines_power[i].set_ydata(power_history[:,i])
+            ax_power.set_ylim(0,power_max+1)
+            plot_lod(ax_power, lines_power, "power")
             fig_power.canvas.flush_events()
         #power consumption live plotting
         if len(sys.argv) == 2 and plot_energy:
             ax_energy.set_xlim(time_history[-1]-plot_energy_window, time_history[-1])
-            ax_energy.set_ylim(0,np.max(energy_history)+1)
-            for i in range(number_modules):
-                lines_energy[i].set_xdata(time_history)
-                lines_energy[i].set_ydata(energy_history[:,i])
+            ax_energy.set_ylim(0,energy_max+1)
+            plot_lod(ax_energy, lines_energy, "energy")
             fig_energy.canvas.flush_events()
         #show plots on screen in real time
         plt.show(block=False)
@@ -432,18 +490,18 @@ if len(sys.argv)==1 and plot_cpg_states:
 #power final plotting
 if len(sys.argv) == 2 and plot_power:
     ax_power.set_xlim(time_history[0], time_history[-1])
-    ax_power.set_ylim(0,np.max(power_history)+1)
-    for i in range(number_modules):
-        lines_power[i].set_xdata(time_history)
-        lines_power[i].set_ydata(power_history[:,i])
+    ax_power.set_ylim(0,power_max+1)
+    plot_lod(ax_power, lines_power, "power")
+    #show a finer level of the pyramid when zooming in
+    ax_power.callbacks.connect("xlim_changed", lambda ax: plot_lod(ax, lines_power, "power"))
 
 #energy final plotting
 if len(sys.argv) == 2 and plot_energy:
     ax_energy.set_xlim(time_history[0], time_history[-1])
-    ax_energy.set_ylim(np.min(energy_history),np.max(energy_history)+1)
-    for i in range(number_modules):
-        lines_energy[i].set_xdata(time_history)
-        lines_energy[i].set_ydata(energy_history[:,i])
+    ax_energy.set_ylim(energy_min,energy_max+1)
+    plot_lod(ax_energy, lines_energy, "energy")
+    #show a finer level of the pyramid when zooming in
+    ax_energy.callbacks.connect("xlim_changed", lambda ax: plot_lod(ax, lines_energy, "energy"))
 
 if (len(sys.argv) == 2 and (plot_energy or plot_power)):
     plt.show()
@@ -0,0 +1,112 @@
+"""
+ * test_loglib.py
+ * Tests of the log files (LogLib.py), run with "python -m unittest" or "python -m pytest" in this folder
+"""
+import os
+import sys
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from LogLib import LogFile
+
+class WriteBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    #steps of the plotter: time starting at the int 0 and incremented by delta_ms, joints in degrees, a "print" event now and then
+    def steps(self, delta_ms, count=25):
+        time = []
+        t = 0
+        for i in range(count):
+            time.append(t)
+            t += delta_ms
+        joints = (np.sin(np.arange(count*3).reshape(count, 3)/7)*90).astype(int)
+        events = [(i, "print", "[CPG] frequency {0}".format(i)) for i in range(0, count, 10)]
+        return time, joints, events
+
+    #same file written with write_batch and with one write() call per row
+    def write_both(self, delta_ms, schema):
+        time, joints, events = self.steps(delta_ms)
+        keys = ["joint{0}".format(i) for i in range(joints.shape[1])]
+        paths = [os.path.join(self.folder.name, name) for name in ["batch.csv", "rows.csv"]]
+        batch = LogFile()
+        batch.new(paths[0], keys, ["print"], schema)
+        batch.write_batch(time, joints, events)
+        batch.close()
+        rows = LogFile()
+        rows.new(paths[1], keys, ["print"], schema)
+        for i in range(len(time)):
+            data = {keys[j]: int(joints[i, j]) for j in range(len(keys))}
+            data["time"] = time[i]
+            for row, key, value in events:
+                if row == i:
+                    data[key] = value
+            rows.write(data)
+        rows.close()
+        return [open(path).read() for path in paths]
+
+    def test_float_delta_ms_is_written_like_write(self):
+        for delta_ms in [0.5, 2.0, 1]:
+            schema = {"time": ("int" if isinstance(delta_ms, int) else "float", "ms"), "print": ("str", "")}
+            for i in range(3):
+                schema["joint{0}".format(i)] = ("int", "deg")
+            batch, rows = self.write_both(delta_ms, schema)
+            self.assertEqual(batch, rows, "delta_ms {0}".format(delta_ms))
+
+    #a write() after a batch uses the last states of the batch, written like the batch wrote them
+    def test_write_after_batch(self):
+        path = os.path.join(self.folder.name, "log.csv")
+        log = LogFile()
+        log.new(path, ["i", "f"], [], {"i": ("int", ""), "f": ("float", "")})
+        log.write_batch([0, 1], np.array([[0.0, 1.5], [2.0, 2.5]]))
+        log.write({"time": 2})
+        log.close()
+        self.assertEqual(open(path).read().split("\n")[-2], "2;2;2.5;")
+
+class SchemaTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, "log.csv")
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    #the schema has the same {key: (type, unit)} shape when writing, when read from the ".schema" file and when read from the header
+    def test_same_shape(self):
+        schema = {"time": ("int", "ms"), "joint0": ("float", "deg"), "print": ("str", "")}
+        log = LogFile()
+        log.new(self.path, ["joint0"], ["print"], schema)
+        log.write({"joint0": 1.5, "time": 0, "print": "start"})
+        log.close()
+        self.assertEqual(log.schema, schema)
+        log.open(self.path)
+        self.assertEqual(log.schema, schema)
+        self.assertEqual(log.read(), {"time": 0, "joint0": 1.5, "print": "start"})
+        log.close()
+        with open(self.path, "w") as file:
+            file.write("time:int:ms;joint0:float:deg;print:str@\n0;1.5;start;\n")
+        os.remove(self.path + ".schema")
+        log.open(self.path)
+        self.assertEqual(log.schema, schema)
+        log.close()
+
+    #an unknown type is rejected the same way in the header and in the ".schema" file
+    def test_unknown_type(self):
+        with open(self.path, "w") as file:
+            file.write("time:int:ms;joint0:double:deg\n0;1.5;\n")
+        with self.assertRaisesRegex(ValueError, "unknown type double for joint0"):
+            LogFile().open(self.path)
+        with open(self.path, "w") as file:
+            file.write("time;joint0\n0;1.5;\n")
+        with open(self.path + ".schema", "w") as file:
+            file.write("key;type;unit\njoint0;double;deg\n")
+        with self.assertRaisesRegex(ValueError, "unknown type double for joint0"):
+            LogFile().open(self.path)
+
+if __name__ == "__main__":
+    unittest.main()
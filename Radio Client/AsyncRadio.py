@@ -0,0 +1,187 @@
+"""
+ * AsyncRadio.py
+ * Asyncio request scheduler to share one radio link between several tasks (shell commands, monitors, watercheck...)
+"""
+import asyncio
+import threading
+import itertools
+import concurrent.futures
+
+#Request priorities, lower is served first (requests of the same priority are served in order)
+PRIORITY_INTERACTIVE = 0    #commands typed in the shell
+PRIORITY_BACKGROUND = 1     #monitors, watercheck and other background jobs
+
+#Asyncio client around a PCRadio: all the requests go through a priority queue served by a single transport task,
+#the serial port is only used by one executor thread so the requests never interleave on the link
+class AsyncPCRadio:
+    def __init__(self, radio, request_timeout=5.0):
+        self.radio = radio
+        self.request_timeout = request_timeout  #default time in seconds a request can wait in the queue and run
+        self.sequence = itertools.count()       #keeps the order of the requests with the same priority
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.jobs = {}                          #background jobs: id -> (description, concurrent future)
+        self.job_ids = itertools.count(1)
+        #the event loop runs in its own thread so that the synchronous wrappers can be called from the shell
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.start(), self.loop).result()
+
+    async def start(self):
+        self.queue = asyncio.PriorityQueue()
+        self.transport_task = asyncio.create_task(self.transport())
+
+    #serves the requests one after the other, by priority
+    async def transport(self):
+        while True:
+            priority, sequence, future, function, args = await self.queue.get()
+            #cancelled or timed out while waiting in the queue
+            if future.done():
+                continue
+            #a request that is already on the link cannot be interrupted, its result is dropped if it was cancelled in the meantime
+            try:
+                result = await self.loop.run_in_executor(self.executor, function, *args)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                continue
+            if not future.done():
+                future.set_result(result)
+
+    #queue a call of function(*args) on the link and wait for its result, raises asyncio.TimeoutError after "timeout" seconds
+    async def submit(self, function, *args, priority=PRIORITY_INTERACTIVE, timeout=None):
+        future = self.loop.create_future()
+        await self.queue.put((priority, next(self.sequence), future, function, args))
+        return await asyncio.wait_for(future, self.request_timeout if timeout is None else timeout)
+
+    # ===== Asynchronous API ===== #
+    #same results as the PCRadio methods (None if the transaction failed or timed out)
+    async def transaction_async(self, operation, address, value=None, validate=None, priority=PRIORITY_INTERACTIVE, timeout=None):
+        try:
+            return await self.submit(self.radio.transaction, operation, address, value, validate, priority=priority, timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    #same as PCRadio.transaction_retry, but the link is free for the other requests during the backoff
+    async def transaction_retry_async(self, operation, address, value=None, validate=None, retries=None, priority=PRIORITY_INTERACTIVE):
+        retries = self.radio.retries if retries is None else retries
+        for attempt in range(retries+1):
+            result = await self.transaction_async(operation, address, value, validate, priority=priority)
+            if result is not None:
+                return result
+            if attempt < retries:
+                await asyncio.sleep(self.radio.retry_delay(attempt))
+        return None
+
+    async def batch_async(self, operation_list, window=None, priority=PRIORITY_INTERACTIVE, timeout=None):
+        try:
+            return await self.submit(self.radio.batch, operation_list, window, priority=priority, timeout=timeout)
+        except asyncio.TimeoutError:
+            return [None]*len(operation_list)
+
+    # ===== Background jobs ===== #
+    #run a coroutine on the event loop, returns its job id
+    def start_job(self, coroutine, description):
+        job_id = next(self.job_ids)
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        self.jobs[job_id] = (description, future)
+        future.add_done_callback(lambda f: self.jobs.pop(job_id, None))
+        return job_id
+
+    def cancel_job(self, job_id):
+        if job_id in self.jobs:
+            self.jobs[job_id][1].cancel()
+            return True
+        return False
+
+    #run a coroutine on the event loop and wait for it (Ctrl+C cancels it)
+    def run(self, coroutine):
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        try:
+            #wait with a timeout so that Ctrl+C is also caught on Windows
+            while True:
+                try:
+                    return future.result(timeout=0.2)
+                except concurrent.futures.TimeoutError:
+                    continue
+        except (KeyboardInterrupt, concurrent.futures.CancelledError):
+            future.cancel()
+            return None
+
+    async def stop(self):
+        self.transport_task.cancel()
+        try:
+            await self.transport_task
+        except asyncio.CancelledError:
+            pass
+
+    def close(self):
+        for job_id in list(self.jobs):
+            self.cancel_job(job_id)
+        asyncio.run_coroutine_threadsafe(self.stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.executor.shutdown()
+
+    # ===== Synchronous wrappers (same methods as PCRadio) ===== #
+    def call(self, function, *args, priority=PRIORITY_INTERACTIVE, timeout=None):
+        return asyncio.run_coroutine_threadsafe(self.submit(function, *args, priority=priority, timeout=timeout), self.loop).result()
+
+    def transaction(self, operation, address, value=None):
+        return asyncio.run_coroutine_threadsafe(self.transaction_async(operation, address, value), self.loop).result()
+
+    def transaction_retry(self, operation, address, value=None, validate=None, retries=None):
+        return asyncio.run_coroutine_threadsafe(self.transaction_retry_async(operation, address, value, validate, retries), self.loop).result()
+
+    def batch(self, operation_list, window=None):
+        return asyncio.run_coroutine_threadsafe(self.batch_async(operation_list, window), self.loop).result()
+
+    def set_channel(self, channel):
+        return self.call(self.radio.set_channel, channel)
+
+    def read_stale(self):
+        return self.call(self.radio.read_stale)
+
+    def resynchronize(self):
+        return self.call(self.radio.resynchronize)
+
+    #the settings of the PCRadio are changed through the scheduler, between two requests (a running batch keeps its settings)
+    def set_window(self, window):
+        return self.call(setattr, self.radio, "window", window)
+
+    def enable_cache(self):
+        return self.call(self.radio.enable_cache)
+
+    def disable_cache(self):
+        return self.call(self.radio.disable_cache)
+
+    def clear_cache(self):
+        return self.call(lambda: self.radio.cache.clear() if self.radio.cache is not None else None)
+
+    def reg_read_8(self, address):
+        return self.transaction("r8", address)
+
+    def reg_read_16(self, address):
+        return self.transaction("r16", address)
+
+    def reg_read_32(self, address):
+        return self.transaction("r32", address)
+
+    def reg_read_float(self, address):
+        return self.transaction("rf", address)
+
+    def reg_write_8(self, address, value):
+        return self.transaction("w8", address, value)
+
+    def reg_write_16(self, address, value):
+        return self.transaction("w16", address, value)
+
+    def reg_write_32(self, address, value):
+        return self.transaction("w32", address, value)
+
+    def reg_write_float(self, address, value):
+        return self.transaction("wf", address, value)
+
+    #the other attributes (window, cache, stats...) are the ones of the PCRadio (read only, use the setters above to change them)
+    def __getattr__(self, name):
+        return getattr(self.radio, name)
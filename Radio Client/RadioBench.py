@@ -0,0 +1,96 @@
+"""
+ * RadioBench.py
+ * Throughput and latency benchmark of the radio link (real dongle or RadioSim stand-in)
+ *
+ * How to use:
+ * "python RadioClient.py -c 81 -p COM3 -b bench.json"      runs all the benchmark cases and writes the results to bench.json
+ * "python RadioClient.py -c 81 -p sim -b bench.json"       same on the simulated dongle
+"""
+import json
+import time
+import datetime
+
+#registers used by the benchmark: reads of the version register and writes to the "map radio address" register,
+#which only changes the mapping being edited (nothing is committed without writing 0xAA to 0x3F0)
+bench_read_address = 0x3E0
+bench_write_address = 0x3F2
+
+#payload mixes, the requests of a mix are repeated until the count of the case is reached
+payload_mixes = {"r8": [("r8", bench_read_address)],
+                 "r16": [("r16", bench_read_address)],
+                 "r32": [("r32", bench_read_address)],
+                 "w8": [("w8", bench_write_address, 0)],
+                 "w16": [("w16", bench_write_address, 0)],
+                 "w32": [("w32", bench_write_address, 0)],
+                 "mixed": [("r8", bench_read_address), ("r16", bench_read_address), ("w16", bench_write_address, 0), ("r32", bench_read_address)],
+                 "telemetry": [("r32", bench_read_address)]*7 + [("w8", bench_write_address, 0)],
+                 }
+#issue modes: "serial" waits for each response before sending the next request, "pipelined" uses PCRadio.batch with the given windows
+bench_windows = [4, 8, 16]
+#number of transactions of each case
+bench_count = 400
+
+#value at the given percentile (0-100) of a sorted list
+def percentile(sorted_values, value):
+    if len(sorted_values) == 0:
+        return None
+    return sorted_values[min(int(round(value/100*(len(sorted_values)-1))), len(sorted_values)-1)]
+
+#run one case, returns its results (the cache is disabled and the link statistics are reset)
+def run_case(radio, mix, mode, window=1, count=bench_count):
+    requests = [payload_mixes[mix][i % len(payload_mixes[mix])] for i in range(count)]
+    radio.stats.clear()
+    start = time.perf_counter()
+    if mode == "serial":
+        results = [radio.transaction(*request) for request in requests]
+    else:
+        results = radio.batch(requests, window)
+    duration = time.perf_counter() - start
+    latencies = sorted([latency for entry in radio.stats.operations.values() for latency in entry["samples"]])
+    outcomes = {}
+    for entry in radio.stats.operations.values():
+        for outcome in entry["counts"]:
+            outcomes[outcome] = outcomes.get(outcome, 0) + entry["counts"][outcome]
+    return {"mix": mix,
+            "mode": mode,
+            "window": window,
+            "transactions": count,
+            "failed": results.count(None),
+            "outcomes": outcomes,
+            "duration_s": duration,
+            "transactions_per_s": count/duration if duration > 0 else None,
+            "latency_ms": {"mean": 1000*sum(latencies)/len(latencies) if len(latencies) > 0 else None,
+                           "p50": None if len(latencies) == 0 else 1000*percentile(latencies, 50),
+                           "p90": None if len(latencies) == 0 else 1000*percentile(latencies, 90),
+                           "p99": None if len(latencies) == 0 else 1000*percentile(latencies, 99),
+                           "max": None if len(latencies) == 0 else 1000*latencies[-1]},
+            }
+
+#run all the cases (every mix in serial and pipelined modes) on a synchronized PCRadio, returns the list of results
+def benchmark(radio, mixes=None, windows=bench_windows, count=bench_count):
+    mixes = list(payload_mixes) if mixes is None else mixes
+    cache = radio.cache
+    radio.cache = None
+    radio.stats.keep_samples = True
+    results = []
+    try:
+        for mix in mixes:
+            for mode, window in [("serial", 1)] + [("pipelined", window) for window in windows]:
+                result = run_case(radio, mix, mode, window, count)
+                print("{0:10} {1:9} window {2:2}: {3:8.1f} transactions/s, latency p50 {4} ms, p99 {5} ms, {6} failed".format(mix, mode, window,
+                    result["transactions_per_s"] or 0, "-" if result["latency_ms"]["p50"] is None else "{0:.2f}".format(result["latency_ms"]["p50"]),
+                    "-" if result["latency_ms"]["p99"] is None else "{0:.2f}".format(result["latency_ms"]["p99"]), result["failed"]))
+                results.append(result)
+    finally:
+        radio.cache = cache
+        radio.stats.keep_samples = False
+        radio.stats.clear()
+    return results
+
+#write the results to a .json file with the description of the setup
+def write_results(file_path, results, setup):
+    with open(file_path, "w") as file:
+        json.dump({"date": datetime.datetime.now().isoformat(timespec="seconds"),
+                   "setup": setup,
+                   "count": bench_count,
+                   "results": results}, file, indent=2)
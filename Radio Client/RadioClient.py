@@ -9,24 +9,28 @@ import serial
 import sys
 import time
 import struct
+import random
+import bisect
+import asyncio
+import os
+from AsyncRadio import AsyncPCRadio, PRIORITY_BACKGROUND
+from RadioMonitor import RegisterMonitor, LogWriter, operation_types
+from RegisterMap import RegisterMap, load_mappings, read_mappings, mapping_sync_requests
 # -c : channel
 # -p : COM port
+# -r : register map file (default: registers.csv next to this file, see RegisterMap.py)
+# -b : benchmark the link and write the results to the given .json file (see RadioBench.py)
 
-#Registers that are read when the "getall" command is executed
-favourite_registers = [{"address":0x3E0, "size":1, "name": "version"},
-          {"address":0x3E1, "size":1, "name": "channel" },
-          {"address":0x3F0, "size":1, "name": "map status"},
-          {"address":0x3F1, "size":1, "name": "map index"},
-          {"address":0x3F2, "size":2, "name": "map radio address"},
-          {"address":0x3F3, "size":2, "name": "map framework address"},
-          {"address":0x3F4, "size":2, "name": "map length"}
-          ]
+#Registers (names of the register map) that are read when the "getall" command is executed
+favourite_registers = ["version", "channel", "map_status", "map_index", "map_radio_address", "map_framework_address", "map_length"]
 
 #Informations to print for the "help" command
 help_print = [{"command": "getb ADDRESS", "description": "Reads an 8 bits register"},
               {"command": "getw ADDRESS", "description": "Reads a 16 bits register"},
               {"command": "getdw ADDRESS", "description": "Reads a 32 bits register"},
               {"command": "getall", "description": "Reads all registers of the favourite list (set in the python file)"},
+              {"command": "get NAME ...", "description": "Reads registers by name (from the register map file)"},
+              {"command": "set NAME VALUE", "description": "Writes a register by name (from the register map file)"},
               {"command": "setb ADDRESS VALUE", "description": "Write an 8 bits register"},
               {"command": "setw ADDRESS VALUE", "description": "Write a 16 bits register"},
               {"command": "setdw ADDRESS VALUE", "description": "Write a 32 bits register"},
@@ -34,9 +38,13 @@ help_print = [{"command": "getb ADDRESS", "description": "Reads an 8 bits regist
               {"command": "mapnew RADIO_ADDRESS FRAMEWORK_ADDRESS LENGTH", "description": "Create a new mapping"},
               {"command": "mapmod MAPPING_INDEX RADIO_ADDRESS FRAMEWORK_ADDRESS LENGTH", "description": "Modifies an existing mapping"},
               {"command": "mapreset", "description": "Deletes all existing mappings"},
+              {"command": "mapsync FILE", "description": "Writes the mappings of the file (radio;framework;length lines) that differ from the mapping table of the robot"},
+              {"command": "cache on|off|clear|stats", "description": "Enables/disables the client-side register cache (policies set in the python file), clears it or prints its statistics"},
+              {"command": "window SIZE", "description": "Sets how many requests are sent before waiting for their responses (getall and map commands)"},
               {"command": "monitorb ADDRESS FREQUENCY", "description": "Reads the 8 bits register at the given frequency"},
               {"command": "monitorw ADDRESS FREQUENCY", "description": "Reads the 16 bits register at the given frequency"},
               {"command": "monitordw ADDRESS FREQUENCY", "description": "Reads the 32 bits register at the given frequency"},
+              {"command": "record FILE FREQUENCY NAME:ADDRESS:TYPE ...", "description": "Reads the registers (TYPE: b, w, dw or f, or only the NAME of the register map) at the given frequency and records them to a log file for the Python Plotter"},
               {"command": "robot start", "description": "Enable the motors"},
               {"command": "robot stop", "description": "Disable the motors"},
               {"command": "cpg start", "description": "Start the CPG controller"},
@@ -53,133 +61,496 @@ help_print = [{"command": "getb ADDRESS", "description": "Reads an 8 bits regist
               {"command": "cpg amplhmaxVALUE", "description": "Set the CPG amplhmax"},
               {"command": "stmreset", "description": "Resets the STM32"},
               {"command": "watercheck FREQUENCY", "description": "monitors the water alert register and tell the user if a leak is detected"},
+              {"command": "linkstats [clear]", "description": "Prints the outcome counters (success, NAK, timeout, invalid) and latency histogram of each operation, or resets them"},
+              {"command": "bg COMMAND", "description": "Runs a monitor, record or watercheck command in the background, the shell stays available"},
+              {"command": "jobs", "description": "Lists the background commands"},
+              {"command": "kill JOB", "description": "Stops a background command"},
               {"command": "exit", "description": "Close the shell"},
               ]
 
+#Register transactions with the robot, the request frame is [opcode<<2 | address>>8, address & 0xFF, value (writes only)]
+#and the response is [0x06 (ACK), value (reads only)], values are little endian
+ACK = 0x06
+
+#precompiled request and response codecs of an operation
+def compile_operation(opcode, value_format):
+    write = (opcode & 0x04) != 0
+    return {"opcode": opcode,
+            "write": write,
+            "request": struct.Struct("<BB" + (value_format if write else "")),
+            "response": struct.Struct("<B" + ("" if write else value_format))}
+
+#supported operations (8 bits reads are unsigned, 16 and 32 bits reads are signed, writes are unsigned)
+operations = {"r8": compile_operation(0x00, "B"),
+              "r16": compile_operation(0x01, "h"),
+              "r32": compile_operation(0x02, "i"),
+              "rf": compile_operation(0x02, "f"),
+              "w8": compile_operation(0x04, "B"),
+              "w16": compile_operation(0x05, "H"),
+              "w32": compile_operation(0x06, "I"),
+              "wf": compile_operation(0x06, "f"),
+              #other signedness, used by the register map
+              "r8s": compile_operation(0x00, "b"),
+              "r16u": compile_operation(0x01, "H"),
+              "r32u": compile_operation(0x02, "I"),
+              "w8s": compile_operation(0x04, "b"),
+              "w16s": compile_operation(0x05, "h"),
+              "w32s": compile_operation(0x06, "i"),
+              }
+
+#registers whose writes trigger an action (mapping commands, STM32 reset), they are not replayed after a desync
+#since the first write may have reached the robot
+replay_exclude = [0x3F0, 0x3E2]
+
+#Register cache policies (when the cache is enabled): "static" registers are read once, a number is a time to live in seconds
+#and the registers that are not listed are never cached (e.g. telemetry like the water alert register 0x201)
+cache_policies = {0x3E0: "static",  #version
+                  0x3E1: "static",  #channel
+                  0x3F0: 5.0,       #map status (map count)
+                  0x3F1: 5.0,       #map index
+                  0x3F2: 5.0,       #map radio address
+                  0x3F3: 5.0,       #map framework address
+                  0x3F4: 5.0,       #map length
+                  }
+#registers that are invalidated together, writing to one of them can change the others
+cache_groups = [[0x3F0, 0x3F1, 0x3F2, 0x3F3, 0x3F4]]
+
+#Link statistics: outcomes of the transactions and latency histogram bucket upper bounds in ms (the last bucket is everything above)
+link_outcomes = ["success", "nak", "timeout", "invalid"]
+latency_buckets = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+
+#Per operation counters of the transaction outcomes and histogram of the latencies (time between the request and its response)
+#"nak" is a response that does not start with an ACK, "timeout" is no response at all and "invalid" is an incomplete or rejected payload
+class LinkStats:
+    def __init__(self):
+        self.keep_samples = False   #also keep every latency (for the benchmark percentiles)
+        self.clear()
+
+    def clear(self):
+        self.operations = {}    #operation -> {"counts": {outcome: count}, "histogram": [count per bucket], "latency": total in seconds, "samples": [latencies]}
+        self.resyncs = 0        #number of times the link was found desynchronized and resynchronized
+
+    def record(self, operation, outcome, latency):
+        entry = self.operations.get(operation)
+        if entry is None:
+            entry = {"counts": dict.fromkeys(link_outcomes, 0), "histogram": [0]*(len(latency_buckets)+1), "latency": 0.0, "samples": []}
+            self.operations[operation] = entry
+        entry["counts"][outcome] += 1
+        #the latency of a timeout is the timeout itself, it is not added to the histogram
+        if outcome != "timeout":
+            entry["histogram"][bisect.bisect_left(latency_buckets, latency*1000)] += 1
+            entry["latency"] += latency
+            if self.keep_samples:
+                entry["samples"].append(latency)
+
+    #lines of text describing the statistics of each operation
+    def report(self):
+        lines = []
+        for operation in sorted(self.operations):
+            entry = self.operations[operation]
+            total = sum(entry["counts"].values())
+            answered = sum(entry["histogram"])
+            lines.append("{0}: {1} transactions, {2}, mean latency {3:.1f}ms".format(operation, total,
+                ", ".join(["{0} {1} ({2:.1f}%)".format(outcome, entry["counts"][outcome], 100*entry["counts"][outcome]/total) for outcome in link_outcomes]),
+                1000*entry["latency"]/answered if answered > 0 else 0))
+            labels = ["<={0}ms".format(bound) for bound in latency_buckets] + [">{0}ms".format(latency_buckets[-1])]
+            lines.append("    " + " ".join(["{0}:{1}".format(labels[i], entry["histogram"][i]) for i in range(len(labels)) if entry["histogram"][i] > 0]))
+        if len(lines) > 0 or self.resyncs > 0:
+            lines.append("resynchronizations: {0}".format(self.resyncs))
+        return lines
+
+#Client-side cache of register values, the entries are per operation and address (an 8 bits and a 16 bits read of the same register are different entries)
+class RegisterCache:
+    def __init__(self, policies, groups):
+        self.policies = dict(policies)
+        self.groups = {}
+        for group in groups:
+            for address in group:
+                self.groups[address] = group
+        self.entries = {}   #(operation, address) -> (value, time)
+        self.hits = 0
+        self.misses = 0
+
+    #cached value of a read, None if it is not cached, expired or rejected by validate (the registers that are never cached do not count as misses)
+    #validate (optional): same check as for a received value, a rejected entry is dropped so that the register is read again
+    def get(self, operation, address, validate=None):
+        policy = self.policies.get(address, "never")
+        if policy == "never":
+            return None
+        entry = self.entries.get((operation, address))
+        if entry is not None and validate is not None and not validate(entry[0]):
+            del self.entries[(operation, address)]
+            entry = None
+        if entry is None or (policy != "static" and time.monotonic() - entry[1] > policy):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[0]
+
+    def put(self, operation, address, value):
+        if self.policies.get(address, "never") != "never" and value is not None:
+            self.entries[(operation, address)] = (value, time.monotonic())
+
+    #forget the register (and its group) after a write
+    def invalidate(self, address):
+        for register in self.groups.get(address, [address]):
+            for key in [key for key in self.entries if key[1] == register]:
+                del self.entries[key]
+
+    def clear(self):
+        self.entries = {}
+
 #Class interfacing with the USB radio dongle
+#port: name of the serial port or pyserial URL (e.g. "COM3", "/dev/ttyUSB0", "rfc2217://host:port") or an already open serial-like object (e.g. RadioSim.SimulatedSerial)
 class PCRadio:
     def __init__(self, port):
-        self.serial = serial.Serial(port, 56800, timeout=1.0)
-        #synchronize with USB radio dongle
-        while(1):
-            for i in range(16):
-                self.serial.write(0xFF.to_bytes(1))
-            self.serial.flush()
-            self.serial.write(0xAA.to_bytes(1))
-            response = self.serial.read(1)
-            if response[0] == 0xAA:
-                print("synchronized")
-                return
-            print("sync failed {0}".format(response[0]))
-            time.sleep(5)
+        self.serial = serial.serial_for_url(port, 56800, timeout=1.0) if isinstance(port, str) else port
+        #the response bytes come together, stop waiting for the rest of a response shortly after its first byte (e.g. when the robot did not ACK)
+        self.serial.inter_byte_timeout = 0.1
+        #buffer in which the request frames are built (the largest frame is 6 bytes)
+        self.tx_buffer = bytearray(8)
+        #maximum number of pipelined requests waiting for their response
+        self.window = 8
+        #optional register cache (see enable_cache)
+        self.cache = None
+        #link quality statistics
+        self.stats = LinkStats()
+        #retries of transaction_retry: exponential backoff with jitter, the n-th retry waits a random time between 0 and min(retry_base*2^n, retry_max) seconds
+        self.retries = 5
+        self.retry_base = 0.05
+        self.retry_max = 2.0
+        #time to wait for the sync response (and for the link to be quiet before sending the sync request)
+        self.sync_timeout = 0.2
+        #number of sync attempts when a desync is detected during a transaction
+        self.resync_attempts = 5
+        #synchronize with USB radio dongle (until it answers)
+        self.synchronize()
+        print("synchronized")
             
     def __del__(self):
         self.serial.close()
+
+    #bytes received that do not belong to any request (the link is not synchronized if there are some)
+    def read_stale(self):
+        return self.serial.read(self.serial.in_waiting)
+
+    #read and drop everything received until the link has been quiet for "quiet" seconds, returns the number of bytes dropped
+    def drain(self, quiet):
+        timeout = self.serial.timeout
+        self.serial.timeout = quiet
+        dropped = 0
+        try:
+            while True:
+                data = self.serial.read(max(1, self.serial.in_waiting))
+                if len(data) == 0:
+                    return dropped
+                dropped += len(data)
+        finally:
+            self.serial.timeout = timeout
+
+    #one sync attempt: the 0xFF complete any partial request frame (and are ignored by the dongle between frames),
+    #the responses still in flight are dropped and the dongle must answer the 0xAA sync request with 0xAA
+    def sync_attempt(self):
+        self.serial.write(b"\xFF"*16)
+        self.serial.flush()
+        self.drain(self.sync_timeout)
+        self.serial.write(b"\xAA")
+        timeout = self.serial.timeout
+        self.serial.timeout = self.sync_timeout
+        try:
+            #a late stale byte can still come before the sync response
+            response = self.serial.read(1)
+            while len(response) == 1 and response[0] != 0xAA:
+                response = self.serial.read(1)
+        finally:
+            self.serial.timeout = timeout
+        return len(response) == 1 and self.serial.in_waiting == 0
+
+    #synchronize with the USB radio dongle, short attempts with backoff (same as the retries), forever if attempts is None
+    def synchronize(self, attempts=None):
+        attempt = 0
+        while attempts is None or attempt < attempts:
+            if self.sync_attempt():
+                return True
+            print("sync failed (attempt {0})".format(attempt+1))
+            time.sleep(self.retry_delay(attempt))
+            attempt += 1
+        return False
+
+    #called when the responses are not aligned with the requests anymore (missing, incomplete or extra bytes)
+    def resynchronize(self):
+        self.stats.resyncs += 1
+        return self.synchronize(self.resync_attempts)
+
+    #a request can be sent again after a desync, except the writes that trigger an action
+    def replayable(self, operation, address):
+        return not (operations[operation]["write"] and address in replay_exclude)
     
-    #change the USB dongle radio channel
+    #enable the client-side register cache, policies: {address: "static" | "never" | time to live in seconds}
+    def enable_cache(self, policies=cache_policies, groups=cache_groups):
+        self.cache = RegisterCache(policies, groups)
+
+    def disable_cache(self):
+        self.cache = None
+
+    #change the USB dongle radio channel (register 0x3C1 of the dongle)
     def set_channel(self, channel):
+        #another channel is another robot, nothing cached is valid anymore
+        if self.cache is not None:
+            self.cache.clear()
         #write the channel
-        self.serial.write(0x13.to_bytes(1))
-        self.serial.write(0xc1.to_bytes(1))
-        self.serial.write(channel.to_bytes(1))
-        if self.serial.read(1)[0] != 0x06:
+        if self.transaction("w8", 0x3C1, channel) is None:
             return False
         #read the channel back
-        self.serial.write(0x03.to_bytes(1))
-        self.serial.write(0xc1.to_bytes(1))
-        response = self.serial.read(2)
-        if(response[0] == 0x06 and response[1] == channel):
+        return self.transaction("r8", 0x3C1) == channel
+
+    #send one request frame in a single write and read the whole response in a single read
+    #returns the value for reads, True for writes and None if the transaction failed
+    #validate (optional): function checking the value of a read, the transaction fails with an "invalid" outcome if it returns False
+    #replay: if the link is found desynchronized (missing response, bytes left over...), resynchronize and send the request again once
+    def transaction(self, operation, address, value=None, validate=None, replay=True):
+        op = operations[operation]
+        if self.cache is not None:
+            if op["write"]:
+                self.cache.invalidate(address)
+            else:
+                cached = self.cache.get(operation, address, validate)
+                if cached is not None:
+                    return cached
+        if op["write"]:
+            op["request"].pack_into(self.tx_buffer, 0, op["opcode"]<<2 | address>>8, address & 0xFF, value)
+        else:
+            op["request"].pack_into(self.tx_buffer, 0, op["opcode"]<<2 | address>>8, address & 0xFF)
+        #bytes left over from an earlier response: the next response would be misaligned
+        if self.serial.in_waiting > 0 and not self.resynchronize():
+            return None
+        start = time.perf_counter()
+        self.serial.write(memoryview(self.tx_buffer)[:op["request"].size])
+        response = self.serial.read(op["response"].size)
+        latency = time.perf_counter() - start
+        #no response, an incomplete one or a NAK followed by other bytes (a NAK is a single byte): the link is desynchronized
+        if len(response) == 0 or len(response) != op["response"].size:
+            self.stats.record(operation, "timeout" if len(response) == 0 else ("nak" if response[0] != ACK else "invalid"), latency)
+            if len(response) == 1 and response[0] != ACK:
+                return None
+            if self.resynchronize() and replay and self.replayable(operation, address):
+                return self.transaction(operation, address, value, validate, replay=False)
+            return None
+        if response[0] != ACK:
+            self.stats.record(operation, "nak", latency)
+            return None
+        if op["write"]:
+            self.stats.record(operation, "success", latency)
             return True
-        return False
+        value = op["response"].unpack(response)[1]
+        if validate is not None and not validate(value):
+            self.stats.record(operation, "invalid", latency)
+            return None
+        self.stats.record(operation, "success", latency)
+        if self.cache is not None:
+            self.cache.put(operation, address, value)
+        return value
+
+    #time to wait before the retry number "attempt" (starting at 0): exponential backoff with full jitter,
+    #so that the retries do not keep colliding with the traffic that made the first request fail
+    def retry_delay(self, attempt):
+        return random.uniform(0, min(self.retry_base*(2**attempt), self.retry_max))
+
+    #transaction retried with backoff until it succeeds (and the value is valid), at most "retries" times (self.retries by default)
+    def transaction_retry(self, operation, address, value=None, validate=None, retries=None):
+        retries = self.retries if retries is None else retries
+        for attempt in range(retries+1):
+            result = self.transaction(operation, address, value, validate)
+            if result is not None:
+                return result
+            if attempt < retries:
+                time.sleep(self.retry_delay(attempt))
+        return None
     
+    #pipelined transactions: the requests are sent back-to-back with at most "window" of them waiting for their response,
+    #the responses come back in the same order as the requests
+    #the responses carry no request number: with a window above 1, a response is only known to be its own once the batch ended
+    #without a timeout, an incomplete response, a NAK or bytes left over (otherwise the batch is replayed one request at a time, see replay)
+    #operations: list of (operation, address) or (operation, address, value), returns one result per operation (None if it failed)
+    #replay: if the responses get misaligned, resynchronize and send the requests again (window of 1) from the first one whose response cannot be trusted
+    def batch(self, operation_list, window=None, replay=True):
+        window = self.window if window is None else max(1, window)
+        #the cached reads are not sent, a write invalidates the cache for the reads that follow it in the batch
+        if self.cache is not None:
+            results = [None]*len(operation_list)
+            pending = []
+            for i in range(len(operation_list)):
+                request = operation_list[i]
+                if operations[request[0]]["write"]:
+                    self.cache.invalidate(request[1])
+                else:
+                    results[i] = self.cache.get(request[0], request[1])
+                if results[i] is None:
+                    pending.append(i)
+            cache = self.cache
+            self.cache = None
+            try:
+                sent_results = self.batch([operation_list[i] for i in pending], window, replay)
+            finally:
+                self.cache = cache
+            #store the values in the order of the requests so that the cache ends up in the state of the last write
+            for i in range(len(pending)):
+                request = operation_list[pending[i]]
+                results[pending[i]] = sent_results[i]
+                if operations[request[0]]["write"]:
+                    self.cache.invalidate(request[1])
+                else:
+                    self.cache.put(request[0], request[1], sent_results[i])
+            return results
+        results = [None]*len(operation_list)
+        sent_times = [0]*len(operation_list)
+        sent = 0
+        desync = None   #index of the first response that showed the link is desynchronized
+        aligned = 0     #number of responses proven to belong to their request (read while no other request was in flight)
+        if self.serial.in_waiting > 0 and not self.resynchronize():
+            return results
+        for received in range(len(operation_list)):
+            #fill the window with new requests, sent in a single write
+            frame = bytearray()
+            first = sent
+            while sent < len(operation_list) and sent - received < window:
+                request = operation_list[sent]
+                op = operations[request[0]]
+                if op["write"]:
+                    frame += op["request"].pack(op["opcode"]<<2 | request[1]>>8, request[1] & 0xFF, request[2])
+                else:
+                    frame += op["request"].pack(op["opcode"]<<2 | request[1]>>8, request[1] & 0xFF)
+                sent += 1
+            if len(frame) > 0:
+                sent_times[first:sent] = [time.perf_counter()]*(sent - first)
+                self.serial.write(frame)
+            #response of the oldest request, the value only follows an ACK
+            operation = operation_list[received][0]
+            op = operations[operation]
+            response = self.serial.read(1)
+            #1 if the response can only belong to this request (nothing else in flight and all the previous responses aligned)
+            alone = int(sent - received == 1 and aligned == received)
+            if len(response) != 1:
+                #a missing response shifts all the following ones
+                self.stats.record(operation, "timeout", time.perf_counter() - sent_times[received])
+                desync = received
+                break
+            if response[0] != ACK:
+                self.stats.record(operation, "nak", time.perf_counter() - sent_times[received])
+                #with other requests in flight, a NAK cannot be told apart from a byte of a shifted response
+                if sent - received > 1:
+                    desync = received
+                    break
+                aligned += alone
+                continue
+            if op["write"]:
+                self.stats.record(operation, "success", time.perf_counter() - sent_times[received])
+                results[received] = True
+                aligned += alone
+                continue
+            response += self.serial.read(op["response"].size - 1)
+            if len(response) == op["response"].size:
+                self.stats.record(operation, "success", time.perf_counter() - sent_times[received])
+                results[received] = op["response"].unpack(response)[1]
+                aligned += alone
+            else:
+                self.stats.record(operation, "invalid", time.perf_counter() - sent_times[received])
+                desync = received
+                break
+        #bytes left over after the last response: the responses were shifted somewhere
+        if desync is None and self.serial.in_waiting > 0:
+            desync = aligned
+        #with several requests in flight, a lost response shifts the following ones and is only noticed later (a read can take
+        #the ACK of the next request and the first bytes of another response as its value), only the responses read while no other
+        #request was in flight are kept, the others are invalidated and sent again
+        if desync is not None:
+            desync = min(desync, aligned)
+            results[desync:] = [None]*(len(operation_list) - desync)
+            if not self.resynchronize():
+                return results
+            #the requests that were sent but whose response was not read may have reached the robot, they must all be replayable
+            #they are sent again one at a time so that each response is checked on its own
+            if replay and all([self.replayable(request[0], request[1]) for request in operation_list[desync:sent]]):
+                results[desync:] = self.batch(operation_list[desync:], 1, replay=False)
+        return results
+
     #read an 8 bits register
     def reg_read_8(self, address):
-        op = 0x00
-        self.serial.write((op<<2 | address>>8).to_bytes(1))
-        self.serial.write((address & 0xFF).to_bytes(1))
-        if self.serial.read(1)[0] != 0x06:
-            return None
-        else:
-            return self.serial.read(1)[0]
+        return self.transaction("r8", address)
     
     #read a 16 bits register as signed int
     def reg_read_16(self, address):
-        op = 0x01
-        self.serial.write((op<<2 | address>>8).to_bytes(1))
-        self.serial.write((address & 0xFF).to_bytes(1))
-        if self.serial.read(1)[0] != 0x06:
-            return None
-        else:
-            return int.from_bytes(self.serial.read(2), byteorder='little', signed=True)
+        return self.transaction("r16", address)
     
     #read a 32 bits register as signed int
     def reg_read_32(self, address):
-        op = 0x02
-        self.serial.write((op<<2 | address>>8).to_bytes(1))
-        self.serial.write((address & 0xFF).to_bytes(1))
-        if self.serial.read(1)[0] != 0x06:
-            return None
-        else:
-            return int.from_bytes(self.serial.read(4), byteorder='little', signed=True)
+        return self.transaction("r32", address)
     
     #read a 32 bits register as float
     def reg_read_float(self, address):
-        op = 0x02
-        self.serial.write((op<<2 | address>>8).to_bytes(1))
-        self.serial.write((address & 0xFF).to_bytes(1))
-        if self.serial.read(1)[0] != 0x06:
-            return None
-        else:
-            return struct.unpack('f', self.serial.read(4))[0]
+        return self.transaction("rf", address)
     
     #write an 8 bits register
     def reg_write_8(self, address, value):
-        op = 0x04
-        self.serial.write((op<<2 | address>>8).to_bytes(1))
-        self.serial.write((address & 0xFF).to_bytes(1))
-        self.serial.write(value.to_bytes(1))
-        if self.serial.read(1)[0] != 0x06:
-            return None
-        else:
-            return True
+        return self.transaction("w8", address, value)
     
     #write a 16 bits register
     def reg_write_16(self, address, value):
-        op = 0x05
-        self.serial.write((op<<2 | address>>8).to_bytes(1))
-        self.serial.write((address & 0xFF).to_bytes(1))
-        self.serial.write(value.to_bytes(2, "little"))
-        if self.serial.read(1)[0] != 0x06:
-            return None
-        else:
-            return True
+        return self.transaction("w16", address, value)
     
     #write a 32 bits register
     def reg_write_32(self, address, value):
-        op = 0x06
-        self.serial.write((op<<2 | address>>8).to_bytes(1))
-        self.serial.write((address & 0xFF).to_bytes(1))
-        self.serial.write(value.to_bytes(4, "little"))
-        if self.serial.read(1)[0] != 0x06:
-            return None
-        else:
-            return True
+        return self.transaction("w32", address, value)
     
     #write a float to a 32 bits register
     def reg_write_float(self, address, value):
-        op = 0x06
-        self.serial.write((op<<2 | address>>8).to_bytes(1))
-        self.serial.write((address & 0xFF).to_bytes(1))
-        self.serial.write(struct.pack("f", value))
-        if self.serial.read(1)[0] != 0x06:
-            return None
+        return self.transaction("wf", address, value)
+
+#Reads a register at a fixed frequency and prints its value (runs on the event loop of an AsyncPCRadio)
+async def monitor_job(client, operation, address, frequency, prefix=""):
+    def print_sample(time_ms, values, event):
+        print("{0}{1} ({2})".format(prefix, "Error" if values[0] is None else values[0], "Error" if values[0] is None else hex(values[0])))
+    monitor = RegisterMonitor(client, [("value", operation, address)], frequency)
+    try:
+        await monitor.run(print_sample)
+    finally:
+        print("{0}{1}".format(prefix, monitor.stats()))
+
+#Reads a set of registers at a fixed frequency and records them to a log file (registers: list of (name, operation, address))
+async def record_job(client, file_path, registers, frequency, prefix=""):
+    writer = LogWriter(file_path, [register[0] for register in registers], [operation_types[register[1]] for register in registers])
+    monitor = RegisterMonitor(client, registers, frequency)
+    try:
+        await monitor.run(writer.put)
+    finally:
+        writer.close()
+        print("{0}Recorded to {1}: {2}".format(prefix, file_path, monitor.stats()))
+
+#the water leak register always reads 0x654321XX (XX: module with a leak), anything else is a corrupted response
+def water_valid(value):
+    return (value&0xFFFFFF00) == 0x65432100
+
+#Reads the water leak register at a fixed frequency, retries with backoff until the response is valid
+async def watercheck_job(client, frequency, prefix=""):
+    loop = asyncio.get_running_loop()
+    next_time = loop.time()
+    while True:
+        value = await client.transaction_retry_async("r32", 0x201, validate=water_valid, priority=PRIORITY_BACKGROUND)
+        if value is None:
+            print("{0}[Error] no valid response after {1} attempts (see linkstats)".format(prefix, client.retries+1))
+        elif(value&0xFF == 0):
+            print("{0}No leak detected ({1})".format(prefix, hex(value)))
         else:
-            return True
+            print("{0}[ALERT] LEAK IN MODULE {1} ({2})".format(prefix, value&0xFF, hex(value)))
+        next_time += 1/frequency
+        await asyncio.sleep(max(next_time - loop.time(), 0))
 
 if __name__ == "__main__":
     #parse the startup command
     channel = None
     port = None
+    bench_file = None
+    register_map_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "registers.csv")
     segments = " ".join(sys.argv[1:])
     segments = segments.split("-")
     parameters = []
@@ -191,14 +562,34 @@ if __name__ == "__main__":
         elif instruction["command"] == "p":
             port = instruction["value"]
             print("port: {0}".format(port))
+        elif instruction["command"] == "b":
+            bench_file = instruction["value"]
+        elif instruction["command"] == "r":
+            register_map_file = instruction["value"]
 
     if (port is None) or (channel is None):
         print("[ERROR] Set the channel number and port with -c CHANNEL and -p COMPORT")
         exit()
 
-    #Setting up the radio dongle
-    radio = PCRadio(port)
+    #Setting up the radio dongle, all the requests go through the asyncio scheduler so that background jobs can share the link
+    #"-p sim" runs the client on a simulated dongle and robot (see RadioSim.py)
+    port_name = port
+    if port == "sim":
+        from RadioSim import SimulatedSerial, SimulatedRobot
+        port = SimulatedSerial(SimulatedRobot(channel=channel))
+    #benchmark mode: measure the link and exit
+    if bench_file is not None:
+        from RadioBench import benchmark, write_results
+        bench_radio = PCRadio(port)
+        if not bench_radio.set_channel(channel):
+            print("[ERROR] could not set the channel of the dongle")
+            exit()
+        write_results(bench_file, benchmark(bench_radio), {"port": port_name, "channel": channel})
+        print("Benchmark results written to {0}".format(bench_file))
+        exit()
+    radio = AsyncPCRadio(PCRadio(port))
     radio.set_channel(channel)
+    register_map = RegisterMap(register_map_file)
 
     #Start the shell
     stop_shell = False
@@ -207,32 +598,81 @@ if __name__ == "__main__":
         while(not stop_shell):
             command = input("> ")
             command = command.split(" ")
+            #run the command in the background (monitor, record and watercheck only)
+            background = False
+            if(command[0] == "bg" and len(command) > 1):
+                background = True
+                command = command[1:]
+
             if(command[0] == "exit"):
                 stop_shell = True
                 break
             
             #check if the UART buffer is still synchronized (for debug)
             elif(command[0] == "sync"):
-                value = radio.serial.in_waiting
-                if(value > 0):
-                    print("bad sync: {0} bytes behind".format(value))
-                    print(", ".join([hex(i) for i in radio.serial.read(value)]))
+                value = radio.read_stale()
+                if(len(value) > 0):
+                    print("bad sync: {0} bytes behind".format(len(value)))
+                    print(", ".join([hex(i) for i in value]))
+                    print("resynchronized" if radio.resynchronize() else "[Error] could not resynchronize")
                     continue
                 else:
                     print("good sync")
                     continue
 
-            #Read all registers of the "favourite" list
+            #Read all registers of the "favourite" list (in one pipelined batch)
             elif(command[0] == "getall"):
-                for i in favourite_registers:
-                    if(i["size"] == 1):
-                        value = radio.reg_read_8(int(i["address"]))                    
-                    elif(i["size"] == 2):
-                        value = radio.reg_read_16(int(i["address"]))
-                    else:
-                        print("{0}({1}): unsupported size".format(i["name"], hex(i["address"])))
-                        continue
-                    print("{0}({1}): {2}".format(i["name"], hex(i["address"]), "Error" if value is None else hex(value)))
+                registers = [name for name in favourite_registers if name in register_map]
+                values = register_map.get(radio, registers)
+                for name in registers:
+                    print("{0}({1}): {2}".format(name, hex(register_map[name]["address"]), register_map.format(name, values[registers.index(name)])))
+
+            #Read registers by name
+            elif(command[0] == "get"):
+                if(len(command) < 2):
+                    print('usage (type "help" for more details): get NAME ...')
+                    continue
+                unknown = [name for name in command[1:] if not name in register_map]
+                if len(unknown) > 0:
+                    print("[Error] unknown register {0}".format(", ".join(unknown)))
+                    continue
+                values = register_map.get(radio, command[1:])
+                for i in range(len(values)):
+                    print("{0}: {1}".format(command[1+i], register_map.format(command[1+i], values[i])))
+
+            #Write a register by name
+            elif(command[0] == "set"):
+                if(len(command) != 3):
+                    print('usage (type "help" for more details): set NAME VALUE')
+                    continue
+                if not command[1] in register_map:
+                    print("[Error] unknown register {0}".format(command[1]))
+                    continue
+                if register_map.set(radio, [(command[1], register_map.parse(command[1], command[2]))])[0] is None:
+                    print("[Error] could not write {0}".format(command[1]))
+
+            #Client-side register cache
+            elif(command[0] == "cache"):
+                if(len(command) != 2):
+                    print('usage (type "help" for more details): cache on | cache off | cache clear | cache stats')
+                    continue
+                if(command[1] == "on"):
+                    radio.enable_cache()
+                elif(command[1] == "off"):
+                    radio.disable_cache()
+                elif(command[1] == "clear"):
+                    radio.clear_cache()
+                elif(command[1] == "stats" and radio.cache is not None):
+                    print("hits: {0}, misses: {1}, entries: {2}".format(radio.cache.hits, radio.cache.misses, len(radio.cache.entries)))
+                print("cache: {0}".format("off" if radio.cache is None else "on"))
+
+            #Set the number of pipelined requests
+            elif(command[0] == "window"):
+                if(len(command) != 2):
+                    print('usage (type "help" for more details): window SIZE')
+                    continue
+                radio.set_window(max(1, int(command[1], 0)))
+                print("window: {0}".format(radio.window))
 
             #Read a register
             elif(command[0][:3] == "get"):
@@ -274,34 +714,50 @@ if __name__ == "__main__":
             
             #Read all mappings
             elif(command[0] == "mapr"): #read all the mappings
-                map_count = radio.reg_read_8(0x3F0)
-                if(map_count>=0xe0):
-                    print("[Error {0}] Mapping access error, please retry".format(hex(map_count)))
+                #select each mapping and read it, all the mappings are read in one pipelined batch
+                mappings = read_mappings(radio)
+                if mappings is None:
                     continue
-                print("mappings: {0}".format(map_count))
-                for i in range(map_count):
-                    radio.reg_write_8(0x3F0, i)
-                    radio_addr = radio.reg_read_16(0x3F2)
-                    frame_addr = radio.reg_read_16(0x3F3)
-                    length = radio.reg_read_16(0x3F4)
-                    index = radio.reg_read_8(0x3F1)
-                    print("{4}: (radio) {0}-{1} <--> {2}-{3} (framework)".format(hex(radio_addr), hex(radio_addr+length-1), hex(frame_addr), hex(frame_addr+length-1), hex(index)))
+                print("mappings: {0}".format(len(mappings)))
+                for i in range(len(mappings)):
+                    radio_addr, frame_addr, length = mappings[i]
+                    print("{4}: (radio) {0}-{1} <--> {2}-{3} (framework)".format(hex(radio_addr), hex(radio_addr+length-1), hex(frame_addr), hex(frame_addr+length-1), hex(i)))
                 continue
+
+            #Write the mappings of a file that differ from the mapping table of the robot
+            elif(command[0] == "mapsync"):
+                if(len(command) != 2):
+                    print('usage (type "help" for more details): mapsync FILE')
+                    continue
+                target = load_mappings(command[1])
+                current = read_mappings(radio)
+                if current is None:
+                    continue
+                requests = mapping_sync_requests(current, target)
+                if len(requests) == 0:
+                    print("The mapping table is already up to date ({0} mappings)".format(len(target)))
+                    continue
+                #all the changed mappings are written in one pipelined batch, then the table is read back
+                radio.batch(requests)
+                if read_mappings(radio) != target:
+                    print("[Error] the mapping table does not match {0} after the sync".format(command[1]))
+                else:
+                    print("Mapping table synchronized ({0} mappings, {1} requests)".format(len(target), len(requests)))
             
             #Create a new mapping
             elif(command[0] == "mapnew"):
                 if(len(command) != 4):
                     print('usage (type "help" for more details): mapnew RADIO_ADDRESS FRAMEWORK_ADDRESS LENGTH')
                     continue
-                map_count = radio.reg_read_8(0x3F0)
-                radio.reg_write_8(0x3F1, 0xFF) #index (new mapping)
-                radio.reg_write_16(0x3F2, int(command[1], 0)) #radio addresss
-                radio.reg_write_16(0x3F3, int(command[2], 0)) #framework address
-                radio.reg_write_16(0x3F4, int(command[3], 0)) #length
-                radio.reg_write_8(0x3F0, 0xAA) #confirm new mapping
-                new_map_count = radio.reg_read_8(0x3F0)
-                if(map_count+1 != new_map_count):
-                    print("[Error {0}]: Could not confirm that the mapping was set".format(hex(new_map_count)))
+                map_count, *writes, new_map_count = radio.batch([("r8", 0x3F0),
+                                                                 ("w8", 0x3F1, 0xFF), #index (new mapping)
+                                                                 ("w16", 0x3F2, int(command[1], 0)), #radio addresss
+                                                                 ("w16", 0x3F3, int(command[2], 0)), #framework address
+                                                                 ("w16", 0x3F4, int(command[3], 0)), #length
+                                                                 ("w8", 0x3F0, 0xAA), #confirm new mapping
+                                                                 ("r8", 0x3F0)])
+                if(map_count is None or new_map_count is None or None in writes or map_count+1 != new_map_count):
+                    print("[Error {0}]: Could not confirm that the mapping was set".format("timeout" if new_map_count is None else hex(new_map_count)))
                 else:
                     print("Mapping {0} registered".format(hex(map_count)))
 
@@ -311,81 +767,87 @@ if __name__ == "__main__":
                     print('usage (type "help" for more details): mapmod MAPPING_INDEX RADIO_ADDRESS FRAMEWORK_ADDRESS LENGTH'.format(command[0]))
                     continue
                 map_count = radio.reg_read_8(0x3F0)
-                if(int(command[1], 0) >= map_count):
+                if(map_count is None or int(command[1], 0) >= map_count):
                     print("[Error] mapping with index {0} does not exist".format(int(command[1], 0)))
                     continue
-                radio.reg_write_8(0x3F1, int(command[1], 0)) #index (new mapping)
-                radio.reg_write_16(0x3F2, int(command[2], 0)) #radio addresss
-                radio.reg_write_16(0x3F3, int(command[3], 0)) #framework address
-                radio.reg_write_16(0x3F4, int(command[4], 0)) #length
-                radio.reg_write_8(0x3F0, 0xAA) #confirm new mapping
+                results = radio.batch([("w8", 0x3F1, int(command[1], 0)), #index (new mapping)
+                                       ("w16", 0x3F2, int(command[2], 0)), #radio addresss
+                                       ("w16", 0x3F3, int(command[3], 0)), #framework address
+                                       ("w16", 0x3F4, int(command[4], 0)), #length
+                                       ("w8", 0x3F0, 0xAA)]) #confirm new mapping
+                if None in results:
+                    print("[Error] Could not confirm that the mapping was modified")
 
             #Delete all the mappings
             elif(command[0] == "mapreset"):
-                radio.reg_write_8(0x3F0, 0xAB)
-                radio.reg_write_8(0x3F0, 0xAC)
+                radio.batch([("w8", 0x3F0, 0xAB), ("w8", 0x3F0, 0xAC)])
 
             #Read a register at a fixed frequency
             elif(command[0][:7] == "monitor"):
                 if(len(command) != 3):
                     print('usage (type "help" for more details): monitorb ADDRESS FREQUENCY | monitorw ADDRESS FREQUENCY | monitordw ADDRESS FREQUENCY'.format(command[0]))
                     continue
-                try:
-                    print("Monitoring of {0} started at {1}Hz (Ctrl+c to stop)".format(command[1], command[2]))
-                    while(True):
-                        start_time = time.time()
-                        if(command[0][7] == "b"): #read 1 byte register
-                            value = radio.reg_read_8(int(command[1], 0))
-                        elif(command[0][7] == "w"):
-                            value = radio.reg_read_16(int(command[1], 0))
-                        elif(command[0][7:9] == "dw"):
-                            value = radio.reg_read_32(int(command[1], 0))
-                        else:
-                            print('usage (type "help" for more details): monitorb ADDRESS FREQUENCY | monitorw ADDRESS FREQUENCY | monitordw ADDRESS FREQUENCY')
-                            break
-                        print("{0} ({1})".format(value, hex(value)))
-                        time.sleep((1/float(command[2])) - (time.time()-start_time))
-                except KeyboardInterrupt:
-                    pass
+                monitor_operations = {"b": "r8", "w": "r16", "dw": "r32"}
+                if not command[0][7:] in monitor_operations:
+                    print('usage (type "help" for more details): monitorb ADDRESS FREQUENCY | monitorw ADDRESS FREQUENCY | monitordw ADDRESS FREQUENCY')
+                    continue
+                if background:
+                    job_id = radio.start_job(monitor_job(radio, monitor_operations[command[0][7:]], int(command[1], 0), float(command[2]), "[{0}] ".format(command[1])), " ".join(command))
+                    print("[job {0}] {1}".format(job_id, " ".join(command)))
+                    continue
+                print("Monitoring of {0} started at {1}Hz (Ctrl+c to stop)".format(command[1], command[2]))
+                radio.run(monitor_job(radio, monitor_operations[command[0][7:]], int(command[1], 0), float(command[2])))
                 print("Monitoring stopped")
 
+            #Read several registers at a fixed frequency and record them to a log file
+            elif(command[0] == "record"):
+                if(len(command) < 4):
+                    print('usage (type "help" for more details): record FILE FREQUENCY NAME:ADDRESS:TYPE ...')
+                    continue
+                record_operations = {"b": "r8", "w": "r16", "dw": "r32", "f": "rf"}
+                registers = []
+                for register in command[3:]:
+                    if register in register_map:
+                        registers.append((register, register_map[register]["read"], register_map[register]["address"]))
+                        continue
+                    register = register.split(":")
+                    if(len(register) != 3 or not register[2] in record_operations):
+                        print("[Error] invalid register {0} (NAME:ADDRESS:TYPE with TYPE b, w, dw or f)".format(":".join(register)))
+                        registers = None
+                        break
+                    registers.append((register[0], record_operations[register[2]], int(register[1], 0)))
+                if registers is None:
+                    continue
+                if background:
+                    job_id = radio.start_job(record_job(radio, command[1], registers, float(command[2]), "[{0}] ".format(command[1])), " ".join(command))
+                    print("[job {0}] {1}".format(job_id, " ".join(command)))
+                    continue
+                print("Recording to {0} at {1}Hz (Ctrl+c to stop)".format(command[1], command[2]))
+                radio.run(record_job(radio, command[1], registers, float(command[2])))
+
             #Starting and stopping the robot
             elif(command[0] == "robot"):
                 if(command[1] == "start"):
-                    radio.reg_write_8(0x00, 1)
+                    register_map.set(radio, [("robot_state", 1)])
                 elif(command[1] == "stop"):
-                    radio.reg_write_8(0x00, 0)
+                    register_map.set(radio, [("robot_state", 0)])
             
-            #Change the CPG parameters
+            #Change the CPG parameters (cpg_* registers of the register map)
             elif(command[0] == "cpg"):
-                if(command[1] == "start"):
-                    radio.reg_write_8(0x101, 2)
+                if(len(command) < 2):
+                    print('usage (type "help" for more details): cpg start | cpg stop | cpg PARAMETER VALUE')
+                elif(command[1] == "start"):
+                    register_map.set(radio, [("cpg_state", 2)])
                 elif(command[1] == "stop"):
-                    radio.reg_write_8(0x101, 0)
-                elif(command[1] == "freq"):
-                    radio.reg_write_float(0x110,float(command[2]))
-                elif(command[1] == "dir"):
-                    radio.reg_write_float(0x111,float(command[2]))
-                elif(command[1] == "amplc"):
-                    radio.reg_write_float(0x112,float(command[2]))
-                elif(command[1] == "amplh"):
-                    radio.reg_write_float(0x113,float(command[2]))
-                elif(command[1] == "nwave"):
-                    radio.reg_write_float(0x114,float(command[2]))
-                elif(command[1] == "coupling"):
-                    radio.reg_write_float(0x115,float(command[2]))
-                elif(command[1] == "ar"):
-                    radio.reg_write_float(0x116,float(command[2]))
-                elif(command[1] == "dirmax"):
-                    radio.reg_write_float(0x120,float(command[2]))
-                elif(command[1] == "amplcmax"):
-                    radio.reg_write_float(0x121,float(command[2]))
-                elif(command[1] == "amplhmax"):
-                    radio.reg_write_float(0x122,float(command[2]))
+                    register_map.set(radio, [("cpg_state", 0)])
+                elif(len(command) == 3 and "cpg_" + command[1] in register_map):
+                    register_map.set(radio, [("cpg_" + command[1], register_map.parse("cpg_" + command[1], command[2]))])
+                else:
+                    print('usage (type "help" for more details): cpg start | cpg stop | cpg PARAMETER VALUE')
 
             #Trigger the reset pin of the STM32
             elif(command[0] == "stmreset"):
-                radio.reg_write_8(0x3E2, 0xAA)
+                register_map.set(radio, [("stm_reset", 0xAA)])
                 continue
             
             #Read the water leak register and checks that the response is correct
@@ -393,27 +855,38 @@ if __name__ == "__main__":
                 if(len(command) != 2):
                     print('usage (type "help" for more details): watercheck FREQUENCY')
                     continue
-                try:
-                    print("Monitoring started at {0}Hz (Ctrl + c to stop)".format(command[1]))
-                    while(True):
-                        value = radio.reg_read_32(0x201)
-                        value = 0 if value is None else value
-                        packet_lost = 0
-                        start_time = time.time()
-                        while((value&0xFFFFFF00) != 0x65432100):    #retry until a valid packet is received
-                            packet_lost += 1
-                            value = radio.reg_read_32(0x201)
-                            value = 0 if value is None else value
-                            time.sleep(0.1)
-                        if(value&0xFF == 0):
-                            print("No leak detected ({0}) [packets lost: {1}]".format(hex(value), packet_lost))
-                        else:
-                            print("[ALERT] LEAK IN MODULE {0} ({1}) [packets lost: {2}]".format(value&0xFF, hex(value), packet_lost))
-                        time.sleep(max((1/float(command[1])) - (time.time()-start_time), 0))
-                except KeyboardInterrupt:
-                    pass
+                if background:
+                    job_id = radio.start_job(watercheck_job(radio, float(command[1]), "[watercheck] "), " ".join(command))
+                    print("[job {0}] {1}".format(job_id, " ".join(command)))
+                    continue
+                print("Monitoring started at {0}Hz (Ctrl + c to stop)".format(command[1]))
+                radio.run(watercheck_job(radio, float(command[1])))
                 print("Monitoring stopped")
                 continue
+
+            #Print the link quality statistics
+            elif(command[0] == "linkstats"):
+                if(len(command) == 2 and command[1] == "clear"):
+                    radio.stats.clear()
+                    continue
+                lines = radio.stats.report()
+                if len(lines) == 0:
+                    print("No transaction yet")
+                for line in lines:
+                    print(line)
+
+            #List the background commands
+            elif(command[0] == "jobs"):
+                for job_id in list(radio.jobs):
+                    print("[job {0}] {1}".format(job_id, radio.jobs[job_id][0]))
+
+            #Stop a background command
+            elif(command[0] == "kill"):
+                if(len(command) != 2):
+                    print('usage (type "help" for more details): kill JOB')
+                    continue
+                if not radio.cancel_job(int(command[1])):
+                    print("[Error] no job {0}".format(command[1]))
                 
             elif(command[0] == "help"):
                 #get the longest command length to pad the others
@@ -426,3 +899,4 @@ if __name__ == "__main__":
                 print("Invalid command")
     except KeyboardInterrupt:
         print("Stopped")
+    radio.close()
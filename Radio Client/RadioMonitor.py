@@ -0,0 +1,100 @@
+"""
+ * RadioMonitor.py
+ * Samples a set of registers at a fixed rate and records them to a log file that can be replayed by the Python Plotter
+"""
+import asyncio
+import threading
+import queue
+from AsyncRadio import PRIORITY_BACKGROUND
+
+#type of the values returned by each read operation (for the schema of the log)
+operation_types = {"r8": "int", "r16": "int", "r32": "int", "rf": "float", "r8s": "int", "r16u": "int", "r32u": "int"}
+
+#Writes the samples to a .csv log in the LogLib format ("time;name1;name2;...;print@" header, one row per sample)
+#The file is written by a background thread so that a slow disk never delays the sampling
+class LogWriter:
+    def __init__(self, file_path, names, types):
+        self.names = names
+        self.queue = queue.Queue()
+        self.file = open(file_path, "w", buffering=1 << 16)
+        self.file.write(";".join(["time"] + names + ["print@"]) + "\n")
+        #schema file with the type of each column (read by LogLib)
+        with open(file_path + ".schema", "w") as schema_file:
+            schema_file.write("key;type;unit\n")
+            schema_file.write("time;int;ms\n")
+            for i in range(len(names)):
+                schema_file.write("{0};{1};\n".format(names[i], types[i]))
+            schema_file.write("print;str;\n")
+        self.thread = threading.Thread(target=self.work, daemon=True)
+        self.thread.start()
+
+    #queue a sample, the values that are None (failed reads) keep their previous value
+    def put(self, time_ms, values, event=None):
+        self.queue.put((time_ms, values, event))
+
+    def work(self):
+        states = [None]*len(self.names)
+        while True:
+            sample = self.queue.get()
+            if sample is None:
+                break
+            time_ms, values, event = sample
+            for i in range(len(values)):
+                if values[i] is not None:
+                    states[i] = values[i]
+            #like LogLib, the rows are only written once all the states have a value
+            if None in states:
+                continue
+            self.file.write(str(time_ms) + ";" + "".join([str(value) + ";" for value in states]) + ("" if event is None else event) + ";\n")
+        self.file.close()
+
+    #write the remaining samples and close the file
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+#Samples a set of registers on a deadline-based schedule: the n-th sample is due at start + n/frequency,
+#so the rate does not drift, and if the link is too slow the late samples are skipped (and counted) instead of accumulating delay
+class RegisterMonitor:
+    def __init__(self, client, registers, frequency):
+        self.client = client            #AsyncPCRadio
+        self.registers = registers      #list of (name, operation, address)
+        self.period = 1/frequency
+        self.samples = 0                #number of samples taken
+        self.missed = 0                 #number of deadlines missed because the link was too slow
+        self.failed = 0                 #number of register reads that failed
+        self.duration = 0
+
+    #achieved sampling rate in Hz
+    def rate(self):
+        return self.samples/self.duration if self.duration > 0 else 0
+
+    def stats(self):
+        return "{0} samples, {1:.2f}Hz achieved ({2:.2f}Hz requested), {3} missed deadlines, {4} failed reads".format(self.samples, self.rate(), 1/self.period, self.missed, self.failed)
+
+    #sample until cancelled, on_sample(time_ms, values, event) is called for each sample (event is a note about missed deadlines or None)
+    async def run(self, on_sample):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        deadline = start
+        event = None
+        try:
+            while True:
+                #all the registers are read in one pipelined batch
+                values = await self.client.batch_async([(register[1], register[2]) for register in self.registers], priority=PRIORITY_BACKGROUND)
+                now = loop.time()
+                self.samples += 1
+                self.failed += values.count(None)
+                self.duration = now - start
+                on_sample(int((now - start)*1000), values, event)
+                event = None
+                #next deadline, skip the ones that are already over
+                deadline += self.period
+                if now > deadline:
+                    late = int((now - deadline)/self.period) + 1
+                    self.missed += late
+                    deadline += late*self.period
+                    event = "missed {0} deadlines".format(late)
+                await asyncio.sleep(deadline - now)
+        finally:
+            self.duration = loop.time() - start
@@ -0,0 +1,221 @@
+"""
+ * RadioSim.py
+ * Software stand-in for the USB radio dongle and the robot, to run and benchmark the radio client without the hardware
+ *
+ * How to use:
+ * "python RadioClient.py -c 81 -p sim"                     runs the client on an in-process simulated dongle (channel 81)
+ * "python RadioSim.py -c 81 --latency 5 --loss 0.01"       creates a pseudo-terminal (Linux/macOS) to use with "python RadioClient.py -c 81 -p /dev/pts/N"
+ * In Python, a SimulatedSerial can be given to PCRadio instead of a port name: PCRadio(SimulatedSerial(SimulatedRobot(channel=81)))
+"""
+import argparse
+import collections
+import os
+import random
+import select
+import struct
+import time
+
+ACK = 0x06
+#response of the dongle when the robot did not answer (assumed, the firmware of the dongle is not in this repository)
+NAK = 0x15
+#dongle channel register (the other registers are forwarded to the robot over the radio)
+DONGLE_CHANNEL = 0x3C1
+
+#size of the value of each opcode in bytes, the writes have the 0x04 bit set
+operation_sizes = {0x00: 1, 0x01: 2, 0x02: 4, 0x04: 1, 0x05: 2, 0x06: 4}
+
+#registers of the robot at power up (framework addresses)
+default_registers = {0x3E0: 0x20,           #version
+                     0x201: 0x65432100,     #water alert register (no leak)
+                     }
+
+#Robot registers with the address mapping of the radio PIC16: the legacy (radio) addresses in a mapping are
+#translated to framework addresses, the mapping table is edited through the registers 0x3F0 to 0x3F4
+class SimulatedRobot:
+    def __init__(self, channel=81, latency=0.005, loss=0.0, nak_on_loss=True, seed=None):
+        self.channel = channel              #radio channel of the robot, it only answers when the dongle is on the same channel
+        self.latency = latency              #radio round-trip time in seconds
+        self.loss = loss                    #probability that a request or its response is lost on the radio
+        self.nak_on_loss = nak_on_loss      #the dongle answers NAK when a radio packet is lost (nothing at all if False)
+        self.random = random.Random(seed)
+        self.registers = dict(default_registers)
+        self.registers[0x3E1] = channel
+        self.mappings = []                  #list of [radio address, framework address, length]
+        self.edit = [0xFF, 0, 0, 0]         #mapping being read or edited: [index, radio address, framework address, length]
+        self.reset_armed = False
+        self.dongle_channel = None
+        self.frame = bytearray()            #request frame being received
+
+    # ===== Address mapping (PIC16) ===== #
+    def translate(self, address):
+        for mapping in self.mappings:
+            if mapping[0] <= address < mapping[0] + mapping[2]:
+                return mapping[1] + address - mapping[0]
+        return address
+
+    def read(self, address):
+        if address == 0x3F0:
+            return len(self.mappings)
+        if 0x3F1 <= address <= 0x3F4:
+            return self.edit[address - 0x3F1]
+        return self.registers.get(self.translate(address), 0)
+
+    def write(self, address, value):
+        if address == 0x3F0:
+            if value == 0xAA:
+                #commit the edited mapping (0xFF: new mapping)
+                if self.edit[0] == 0xFF:
+                    self.mappings.append(self.edit[1:])
+                elif self.edit[0] < len(self.mappings):
+                    self.mappings[self.edit[0]] = self.edit[1:]
+            elif value == 0xAB:
+                self.reset_armed = True
+                return
+            elif value == 0xAC and self.reset_armed:
+                self.mappings = []
+            elif value < len(self.mappings):
+                #select a mapping to read it
+                self.edit = [value] + list(self.mappings[value])
+            self.reset_armed = False
+            return
+        self.reset_armed = False
+        if 0x3F1 <= address <= 0x3F4:
+            self.edit[address - 0x3F1] = value
+            return
+        self.registers[self.translate(address)] = value
+
+    # ===== Dongle protocol ===== #
+    #process one byte received by the dongle, returns the list of (response, went over the radio) it triggers
+    def feed(self, byte):
+        if len(self.frame) == 0:
+            opcode = byte >> 2
+            if not opcode in operation_sizes:
+                #sync request, the 0xFF (and other invalid opcodes) are ignored between frames
+                if byte == 0xAA:
+                    return [(b"\xAA", False)]
+                return []
+        self.frame.append(byte)
+        opcode = self.frame[0] >> 2
+        write = (opcode & 0x04) != 0
+        size = operation_sizes[opcode]
+        if len(self.frame) < 2 + (size if write else 0):
+            return []
+        address = (self.frame[0] & 0x03) << 8 | self.frame[1]
+        value = int.from_bytes(self.frame[2:], "little") if write else None
+        self.frame = bytearray()
+        #the channel register belongs to the dongle
+        if address == DONGLE_CHANNEL:
+            if write:
+                self.dongle_channel = value
+                return [(bytes([ACK]), False)]
+            return [(bytes([ACK]) + (self.dongle_channel or 0).to_bytes(size, "little"), False)]
+        #everything else goes to the robot over the radio
+        if self.dongle_channel != self.channel or self.random.random() < self.loss:
+            return [(bytes([NAK]), True)] if self.nak_on_loss else []
+        if write:
+            self.write(address, value)
+            return [(bytes([ACK]), True)]
+        #floats are stored as their 32 bits pattern
+        value = self.read(address)
+        if isinstance(value, float):
+            value = struct.unpack("<I", struct.pack("<f", value))[0]
+        return [(bytes([ACK]) + (value & ((1 << 8*size) - 1)).to_bytes(size, "little"), True)]
+
+#In-process serial port connected to a simulated dongle (same methods as the pyserial ports used by PCRadio)
+#the bytes take 10/baudrate seconds each on the serial link and the radio adds the latency of the robot
+class SimulatedSerial:
+    def __init__(self, robot=None, baudrate=57600, timeout=1.0):
+        self.robot = SimulatedRobot() if robot is None else robot
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.inter_byte_timeout = None
+        self.is_open = True
+        self.received = collections.deque()     #(time at which the byte is available, byte)
+        self.uplink_free = 0                    #time at which the PC to dongle link is free
+        self.downlink_free = 0                  #time at which the dongle to PC link is free
+
+    def write(self, data):
+        byte_time = 10/self.baudrate
+        start = max(time.monotonic(), self.uplink_free)
+        data = bytes(data)
+        for i in range(len(data)):
+            arrival = start + (i+1)*byte_time
+            for response, radio in self.robot.feed(data[i]):
+                ready = arrival + (self.robot.latency if radio else 0)
+                for byte in response:
+                    self.downlink_free = max(ready, self.downlink_free) + byte_time
+                    self.received.append((self.downlink_free, byte))
+        self.uplink_free = start + len(data)*byte_time
+        return len(data)
+
+    def flush(self):
+        pass
+
+    #read "size" bytes, returns less if the timeout (or the inter byte timeout after the first byte) expires
+    def read(self, size=1):
+        data = bytearray()
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while len(data) < size:
+            now = time.monotonic()
+            if len(self.received) > 0 and self.received[0][0] <= now:
+                last = self.received.popleft()
+                data.append(last[1])
+                continue
+            limit = deadline
+            if len(data) > 0 and self.inter_byte_timeout is not None:
+                limit = last[0] + self.inter_byte_timeout if limit is None else min(limit, last[0] + self.inter_byte_timeout)
+            if len(self.received) == 0 or (limit is not None and self.received[0][0] > limit):
+                #nothing will arrive in time
+                if limit is not None:
+                    time.sleep(max(limit - now, 0))
+                break
+            time.sleep(self.received[0][0] - now)
+        return bytes(data)
+
+    @property
+    def in_waiting(self):
+        now = time.monotonic()
+        return sum(1 for byte in self.received if byte[0] <= now)
+
+    def reset_input_buffer(self):
+        now = time.monotonic()
+        while len(self.received) > 0 and self.received[0][0] <= now:
+            self.received.popleft()
+
+    def close(self):
+        self.is_open = False
+
+#serve a simulated dongle on a pseudo-terminal until Ctrl+C
+def run_pty(robot, baudrate):
+    import tty
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    print("Simulated dongle on {0} (channel {1}), Ctrl+C to stop".format(os.ttyname(slave), robot.channel))
+    link = SimulatedSerial(robot, baudrate, timeout=0)
+    try:
+        while True:
+            #wait for a request or for the next response byte to be due
+            wait = None
+            if len(link.received) > 0:
+                wait = max(link.received[0][0] - time.monotonic(), 0)
+            readable, _, _ = select.select([master], [], [], wait)
+            if master in readable:
+                link.write(os.read(master, 1024))
+            ready = link.in_waiting
+            if ready > 0:
+                os.write(master, link.read(ready))
+    except KeyboardInterrupt:
+        print("Stopped")
+    os.close(slave)
+    os.close(master)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulated USB radio dongle and robot on a pseudo-terminal")
+    parser.add_argument("-c", "--channel", type=int, default=81, help="radio channel of the simulated robot")
+    parser.add_argument("--latency", type=float, default=5, help="radio round-trip time in ms")
+    parser.add_argument("--baudrate", type=int, default=57600, help="speed of the serial link in bauds")
+    parser.add_argument("--loss", type=float, default=0.0, help="probability that a radio packet is lost")
+    parser.add_argument("--silent-loss", action="store_true", help="lost packets get no response instead of a NAK")
+    parser.add_argument("--seed", type=int, help="seed of the packet loss")
+    args = parser.parse_args()
+    run_pty(SimulatedRobot(args.channel, args.latency/1000, args.loss, not args.silent_loss, args.seed), args.baudrate)
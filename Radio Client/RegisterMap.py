@@ -0,0 +1,141 @@
+"""
+ * RegisterMap.py
+ * Register map of the robot (name, address, width and type of each register) and synchronization of the PIC16 address mapping table
+ *
+ * Register map file (";" separated, one register per line):
+ *   name;address;width;type
+ *   cpg_freq;0x110;32;float
+ * width is 8, 16 or 32 and type is "unsigned", "signed" or "float" (32 bits only)
+ *
+ * Mapping file (";" separated, one mapping per line, in the order of the mapping table):
+ *   radio;framework;length
+ *   0x10;0x500;4
+"""
+
+#read and write operations (see "operations" in RadioClient.py) of each width and type
+register_operations = {(8, "unsigned"): ("r8", "w8"),
+                       (8, "signed"): ("r8s", "w8s"),
+                       (16, "unsigned"): ("r16u", "w16"),
+                       (16, "signed"): ("r16", "w16s"),
+                       (32, "unsigned"): ("r32u", "w32"),
+                       (32, "signed"): ("r32", "w32s"),
+                       (32, "float"): ("rf", "wf"),
+                       }
+
+#Registers of the robot by name, each register is resolved once to the precompiled operations (struct codecs) used to read and write it
+class RegisterMap:
+    def __init__(self, file_path=None):
+        self.registers = {}     #name -> {"name", "address", "width", "type", "read", "write"}
+        if file_path is not None:
+            self.load(file_path)
+
+    def load(self, file_path):
+        with open(file_path, "r") as file:
+            header = file.readline().strip().split(";")
+            if header[:4] != ["name", "address", "width", "type"]:
+                raise(ValueError("{0}: the header must be name;address;width;type".format(file_path)))
+            line_number = 1
+            for line in file:
+                line_number += 1
+                values = line.strip().split(";")
+                if len(values) < 4 or values[0] == "":
+                    continue
+                try:
+                    width = int(values[2])
+                    address = int(values[1], 0)
+                except ValueError as e:
+                    raise(ValueError("{0} line {1}: {2}".format(file_path, line_number, e)))
+                if not (width, values[3]) in register_operations:
+                    raise(ValueError("{0} line {1}: unsupported register {2} bits {3}".format(file_path, line_number, width, values[3])))
+                read, write = register_operations[(width, values[3])]
+                self.registers[values[0]] = {"name": values[0], "address": address, "width": width, "type": values[3], "read": read, "write": write}
+
+    def __contains__(self, name):
+        return name in self.registers
+
+    def __getitem__(self, name):
+        return self.registers[name]
+
+    #value typed in the shell for a register
+    def parse(self, name, text):
+        return float(text) if self.registers[name]["type"] == "float" else int(text, 0)
+
+    #value of a register for the shell
+    def format(self, name, value):
+        if value is None:
+            return "Error"
+        if self.registers[name]["type"] == "float":
+            return str(value)
+        return "{0} ({1})".format(value, hex(value))
+
+    #read registers by name in one pipelined batch, returns one value per name (None if the read failed)
+    def get(self, radio, names):
+        return radio.batch([(self.registers[name]["read"], self.registers[name]["address"]) for name in names])
+
+    #write registers by name in one pipelined batch, values: list of (name, value), returns one result per write
+    def set(self, radio, values):
+        return radio.batch([(self.registers[name]["write"], self.registers[name]["address"], value) for name, value in values])
+
+# ===== PIC16 address mapping table ===== #
+# The mappings are edited through the registers 0x3F0 (count, selection and commands), 0x3F1 (index, 0xFF for a new mapping),
+# 0x3F2 (radio address), 0x3F3 (framework address) and 0x3F4 (length), a mapping is committed by writing 0xAA to 0x3F0
+# and all the mappings are deleted by writing 0xAB then 0xAC to 0x3F0
+
+#mappings of a mapping file, list of (radio address, framework address, length)
+def load_mappings(file_path):
+    mappings = []
+    with open(file_path, "r") as file:
+        header = file.readline().strip().split(";")
+        if header[:3] != ["radio", "framework", "length"]:
+            raise(ValueError("{0}: the header must be radio;framework;length".format(file_path)))
+        line_number = 1
+        for line in file:
+            line_number += 1
+            values = line.strip().split(";")
+            if len(values) < 3 or values[0] == "":
+                continue
+            try:
+                mappings.append((int(values[0], 0), int(values[1], 0), int(values[2], 0)))
+            except ValueError as e:
+                raise(ValueError("{0} line {1}: {2}".format(file_path, line_number, e)))
+    return mappings
+
+#read the mapping table of the robot in one pipelined batch, returns a list of (radio address, framework address, length)
+#or None if it could not be read (the error is printed)
+def read_mappings(radio):
+    map_count = radio.transaction("r8", 0x3F0)
+    if(map_count is None or map_count >= 0xE0):
+        print("[Error {0}] Mapping access error, please retry".format("timeout" if map_count is None else hex(map_count)))
+        return None
+    requests = []
+    for i in range(map_count):
+        requests += [("w8", 0x3F0, i), ("r16u", 0x3F2), ("r16u", 0x3F3), ("r16u", 0x3F4), ("r8", 0x3F1)]
+    results = radio.batch(requests)
+    mappings = []
+    for i in range(map_count):
+        selected, radio_address, framework_address, length, index = results[5*i:5*i+5]
+        if None in (selected, radio_address, framework_address, length, index):
+            print("{0}: [Error] could not read the mapping".format(hex(i)))
+            return None
+        mappings.append((radio_address, framework_address, length))
+    return mappings
+
+#requests to write one mapping, index 0xFF creates a new mapping
+def mapping_requests(index, mapping):
+    return [("w8", 0x3F1, index), ("w16", 0x3F2, mapping[0]), ("w16", 0x3F3, mapping[1]), ("w16", 0x3F4, mapping[2]), ("w8", 0x3F0, 0xAA)]
+
+#requests that change the "current" mapping table into the "target" one, only the mappings that differ are written,
+#the table is reset and written again if it has to shrink (single mappings cannot be deleted)
+def mapping_sync_requests(current, target):
+    if len(target) < len(current):
+        requests = [("w8", 0x3F0, 0xAB), ("w8", 0x3F0, 0xAC)]
+        for mapping in target:
+            requests += mapping_requests(0xFF, mapping)
+        return requests
+    requests = []
+    for i in range(len(target)):
+        if i >= len(current):
+            requests += mapping_requests(0xFF, target[i])
+        elif tuple(current[i]) != tuple(target[i]):
+            requests += mapping_requests(i, target[i])
+    return requests
@@ -0,0 +1,51 @@
+"""
+ * test_radio.py
+ * Tests of the radio client on the simulated dongle (RadioSim.py), run with "python -m unittest" or "python -m pytest" in this folder
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from RadioSim import SimulatedSerial, SimulatedRobot
+from RadioClient import PCRadio
+
+#radio on a simulated robot whose lost packets get no response at all (the responses that follow are shifted)
+def silent_loss_radio(seed, loss=0.1):
+    robot = SimulatedRobot(channel=3, nak_on_loss=False, seed=seed)
+    radio = PCRadio(SimulatedSerial(robot, timeout=0.2))
+    radio.set_channel(3)
+    robot.loss = loss
+    return robot, radio
+
+class BatchSilentLossTest(unittest.TestCase):
+    #a pipelined batch never reports a value or a write that did not come from its own request
+    def test_pipelined_results_are_not_shifted(self):
+        for seed in range(5):
+            robot, radio = silent_loss_radio(seed)
+            operation_list = []
+            for v in range(40):
+                operation_list += [("w16", 0x100+v, v*3), ("r16", 0x100+v)]
+            results = radio.batch(operation_list, window=8)
+            for i in range(0, len(operation_list), 2):
+                if results[i] is not None:
+                    self.assertEqual(robot.registers.get(operation_list[i][1]), operation_list[i][2], "seed {0}, write {1}".format(seed, i))
+                if results[i+1] is not None:
+                    self.assertEqual(results[i+1], operation_list[i][2], "seed {0}, read {1}".format(seed, i+1))
+
+    #one request at a time, every response is checked on its own and the ones before a lost response are kept
+    def test_serial_results_are_kept(self):
+        robot, radio = silent_loss_radio(0)
+        operation_list = []
+        for v in range(20):
+            operation_list += [("w16", 0x100+v, v*3), ("r16", 0x100+v)]
+        results = radio.batch(operation_list, window=1, replay=False)
+        self.assertGreater(len([result for result in results if result is not None]), len(operation_list)//2)
+        for i in range(0, len(operation_list), 2):
+            if results[i] is not None:
+                self.assertEqual(robot.registers.get(operation_list[i][1]), operation_list[i][2])
+            if results[i+1] is not None:
+                self.assertEqual(results[i+1], operation_list[i][2])
+
+if __name__ == "__main__":
+    unittest.main()